@@ -1,63 +1,82 @@
+import argparse
 import asyncio
+import os
 import platform
 import pygame
 import sys
-import random
-import math
+import time
+from tron_engine import WIDTH, HEIGHT, GRID_SIZE, BLUE, RED, GREEN, FixedTimestep, Player, reset, step
+import tron_engine
+import tron_net
+from tron_render import TrailLayer, background, render_text
+from tron_timing import PhaseTimer, ProfileCapture
+from tron_replay import ReplayRecorder
+from tron_worker import BotWorker
 
 # Initialize Pygame
 pygame.init()
 
-# Constants
-WIDTH, HEIGHT = 800, 600
-GRID_SIZE = 10
-FPS = 10
-
 # Colors
 BLACK = (0, 0, 0)
-BLUE = (0, 0, 255)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
 WHITE = (255, 255, 255)
 GRAY = (128, 128, 128)
 GRID_COLOR = (50, 50, 50)
 
+RENDER_FPS = 60  # frames drawn per second; the match itself runs at game_state.tick_rate
+TIMINGS_REFRESH = 0.5  # seconds between updates of the timings overlay
+TIMINGS_BOTS = 3  # slowest bots (by p99) listed in the overlay; the csv has every one
+TIMINGS_CSV = "tron_timings.csv"
+REPLAY_DIR = "replays"
+
+# --arena COLSxROWS plays on an arena bigger than the window, seen through a
+# camera that follows player 1 (Tab moves it to the next bike). Network
+# matches always use the classic arena. --bikes sets how many bikes a
+# free-for-all has.
+def parse_options(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--arena", default=f"{WIDTH // GRID_SIZE}x{HEIGHT // GRID_SIZE}")
+    parser.add_argument("--bikes", type=int, default=tron_engine.FFA_BIKES)
+    args, _ = parser.parse_known_args(argv)
+    cols, _, rows = args.arena.lower().partition("x")
+    if (not (cols.isdigit() and rows.isdigit()) or int(cols) * GRID_SIZE < WIDTH or int(rows) * GRID_SIZE < HEIGHT
+            or max(int(cols), int(rows)) > tron_engine.MAX_ARENA):
+        parser.error(f"--arena takes COLSxROWS, at least {WIDTH // GRID_SIZE}x{HEIGHT // GRID_SIZE} "
+                     f"and at most {tron_engine.MAX_ARENA} a side")
+    if not 2 <= args.bikes <= tron_engine.MAX_BIKES:
+        parser.error(f"--bikes takes 2 to {tron_engine.MAX_BIKES}")
+    return (int(cols) * GRID_SIZE, int(rows) * GRID_SIZE), args.bikes
+
+ARENA, FFA_BIKES = parse_options(sys.argv[1:])
+
 # Set up display
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Tron 2D Game")
 clock = pygame.time.Clock()
 font = pygame.font.SysFont('Arial', 36)
 small_font = pygame.font.SysFont('Arial', 24)
+timing_font = pygame.font.SysFont('Courier New', 14)
 
-# Player class
-class Player:
-    def __init__(self, x, y, dx, dy, color, name):
-        self.x = x
-        self.y = y
-        self.dx = dx
-        self.dy = dy
-        self.color = color
-        self.name = name
-        self.trail = [(x, y)]
-
-# Game state
-class GameState:
+# Game state: the engine's match state plus the menu and console bits
+class GameState(tron_engine.GameState):
     def __init__(self):
+        super().__init__(*ARENA)
+        self.bike_count = FFA_BIKES
         self.state = "menu"  # "menu", "ai_difficulty", "game"
-        self.player1 = Player(100, 300, GRID_SIZE, 0, BLUE, "Player 1")
-        self.player2 = Player(700, 300, -GRID_SIZE, 0, RED, "Player 2")
-        self.player3 = None  # Used in Dual AI Mode for AI 2
-        self.game_over = False
         self.player1_name = "Player 1"
         self.player2_name = "Player 2"
         self.active_input = None
-        self.game_mode = None  # "two_player", "ai", "dual_ai"
-        self.ai_difficulty = None  # "easy", "medium", "hard", "extreme"
         self.console_active = False
-        self.god_mode = False
-        self.ai_target_player = True
+        self.show_timings = False
+        self.profile = None  # ProfileCapture while a profile console command is running
+        self.save_replays = False  # write each finished match to REPLAY_DIR
+        self.peer = None  # tron_net.LockstepPeer when playing over the network
+        self.camera_target = 0  # index of the bike the camera follows on a big arena
 
 game_state = GameState()
+timer = PhaseTimer()  # How long each phase of a game frame took, see the timings console command
+timing_overlay = {"lines": [], "refreshed": 0.0}
+recorder = ReplayRecorder()
+bot_worker = BotWorker()  # the bots think on their own thread, see tron_worker
 
 # Input box class
 class InputBox:
@@ -65,7 +84,7 @@ class InputBox:
         self.rect = pygame.Rect(x, y, w, h)
         self.color = WHITE
         self.text = text
-        self.txt_surface = small_font.render(text, True, self.color)
+        self.txt_surface = render_text(small_font, text, self.color)
         self.active = False
 
     def handle_event(self, event):
@@ -79,7 +98,7 @@ class InputBox:
             else:
                 if len(self.text) < 20:
                     self.text += event.unicode
-            self.txt_surface = small_font.render(self.text, True, self.color)
+            self.txt_surface = render_text(small_font, self.text, self.color)
         return self.active, self.text
 
 # Button class
@@ -88,7 +107,7 @@ class Button:
         self.rect = pygame.Rect(x, y, w, h)
         self.color = GRAY
         self.text = text
-        self.txt_surface = small_font.render(text, True, BLACK)
+        self.txt_surface = render_text(small_font, text, BLACK)
 
     def draw(self, screen):
         pygame.draw.rect(screen, self.color, self.rect)
@@ -102,12 +121,15 @@ class Button:
 player1_input = InputBox(200, 300, 140, 32, "Player 1")
 player2_input = InputBox(460, 300, 140, 32, "Player 2")
 two_player_button = Button(200, 400, 100, 50, "Two Player")
+ffa_button = Button(200, 470, 100, 50, "FFA")
 ai_mode_button = Button(350, 400, 100, 50, "AI Mode")
 dual_ai_button = Button(500, 400, 150, 50, "Dual AI Mode")  # Increased width to 150
 easy_button = Button(200, 300, 100, 50, "Easy")
 medium_button = Button(350, 300, 100, 50, "Medium")
 hard_button = Button(500, 300, 100, 50, "Hard")
 extreme_button = Button(650, 300, 100, 50, "Extreme")
+insane_button = Button(500, 400, 100, 50, "Insane")
+mcts_button = Button(650, 400, 100, 50, "MCTS")
 back_button = Button(350, 400, 100, 50, "Back")
 console_input = InputBox(50, HEIGHT - 40, WIDTH - 100, 32, "")
 
@@ -134,6 +156,9 @@ def handle_menu_input():
                 elif dual_ai_button.is_clicked(event.pos):
                     game_state.state = "ai_difficulty"
                     game_state.game_mode = "dual_ai"
+                elif ffa_button.is_clicked(event.pos):
+                    game_state.state = "ai_difficulty"
+                    game_state.game_mode = "ffa"
         elif game_state.state == "ai_difficulty":
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if easy_button.is_clicked(event.pos):
@@ -164,16 +189,30 @@ def handle_menu_input():
                     game_state.player3 = Player(400, 100, 0, GRID_SIZE, GREEN, "AI 2") if game_state.game_mode == "dual_ai" else None
                     game_state.state = "game"
                     reset_game()
+                elif insane_button.is_clicked(event.pos):
+                    game_state.ai_difficulty = "insane"
+                    game_state.player1.name = game_state.player1_name
+                    game_state.player2.name = "AI 1"
+                    game_state.player3 = Player(400, 100, 0, GRID_SIZE, GREEN, "AI 2") if game_state.game_mode == "dual_ai" else None
+                    game_state.state = "game"
+                    reset_game()
+                elif mcts_button.is_clicked(event.pos):
+                    game_state.ai_difficulty = "mcts"
+                    game_state.player1.name = game_state.player1_name
+                    game_state.player2.name = "AI 1"
+                    game_state.player3 = Player(400, 100, 0, GRID_SIZE, GREEN, "AI 2") if game_state.game_mode == "dual_ai" else None
+                    game_state.state = "game"
+                    reset_game()
                 elif back_button.is_clicked(event.pos):
                     game_state.state = "menu"
 
 def draw_menu():
     screen.fill(BLACK)
     if game_state.state == "menu":
-        title = font.render("Tron 2D Game", True, WHITE)
+        title = render_text(font, "Tron 2D Game", WHITE)
         screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
-        player1_label = small_font.render("Player 1 Name:", True, WHITE)
-        player2_label = small_font.render("Player 2 Name:", True, WHITE)
+        player1_label = render_text(small_font, "Player 1 Name:", WHITE)
+        player2_label = render_text(small_font, "Player 2 Name:", WHITE)
         screen.blit(player1_label, (200, 270))
         screen.blit(player2_label, (460, 270))
         player1_input.color = BLUE if player1_input.active else WHITE
@@ -185,83 +224,21 @@ def draw_menu():
         two_player_button.draw(screen)
         ai_mode_button.draw(screen)
         dual_ai_button.draw(screen)
+        ffa_button.draw(screen)
     elif game_state.state == "ai_difficulty":
-        title = font.render("Select AI Difficulty", True, WHITE)
+        title = render_text(font, "Select AI Difficulty", WHITE)
         screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
         easy_button.draw(screen)
         medium_button.draw(screen)
         hard_button.draw(screen)
         extreme_button.draw(screen)
+        insane_button.draw(screen)
+        mcts_button.draw(screen)
         back_button.draw(screen)
 
-def ai_move(player, is_ai1):
-    directions = [
-        (GRID_SIZE, 0), (-GRID_SIZE, 0), (0, -GRID_SIZE), (0, GRID_SIZE)
-    ]
-    opposite = (-player.dx, -player.dy)
-    directions = [d for d in directions if d != opposite]
-    
-    if game_state.ai_difficulty == "easy":
-        max_steps = 20 if is_ai1 else 10
-        trap_player = game_state.ai_target_player and not is_ai1
-    elif game_state.ai_difficulty == "medium":
-        max_steps = 30 if is_ai1 else 15
-        trap_player = game_state.ai_target_player and not is_ai1
-    elif game_state.ai_difficulty == "hard":
-        max_steps = 40 if is_ai1 else 20
-        trap_player = game_state.ai_target_player
-    else:  # extreme
-        max_steps = 60 if is_ai1 else 30
-        trap_player = game_state.ai_target_player
-
-    safe_directions = []
-    scores = []
-    all_trails = game_state.player1.trail[:-1] + game_state.player2.trail[:-1]
-    if game_state.player3:
-        all_trails += game_state.player3.trail[:-1]
-
-    for dx, dy in directions:
-        new_x, new_y = player.x + dx, player.y + dy
-        if not (new_x < 0 or new_x >= WIDTH or new_y < 0 or new_y >= HEIGHT):
-            collision = False
-            for segment in all_trails:
-                if (new_x, new_y) == segment:
-                    collision = True
-                    break
-            if not collision:
-                safe_directions.append((dx, dy))
-                steps = 0
-                x, y = new_x, new_y
-                while 0 <= x < WIDTH and 0 <= y < HEIGHT and steps < max_steps:
-                    if (x, y) in all_trails:
-                        break
-                    steps += 1
-                    x += dx
-                    y += dy
-                score = steps
-                if trap_player:
-                    targets = [game_state.player1]
-                    if game_state.player3 and player != game_state.player3:
-                        targets.append(game_state.player3)
-                    elif game_state.player2 and player != game_state.player2:
-                        targets.append(game_state.player2)
-                    min_dist = float('inf')
-                    for target in targets:
-                        dist = math.hypot(target.x - new_x, target.y - new_y)
-                        min_dist = min(min_dist, dist)
-                    score += max(0, 50 - min_dist) * (0.1 if is_ai1 else 0.3)
-                scores.append(score)
-    
-    if safe_directions:
-        if scores:
-            best_idx = scores.index(max(scores))
-            player.dx, player.dy = safe_directions[best_idx]
-        else:
-            player.dx, player.dy = random.choice(safe_directions)
-    else:
-        pass
-
 def handle_game_input():
+    # Key presses become engine commands, applied in order at the next step
+    actions = {0: [], 1: []}
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             pygame.quit()
@@ -272,133 +249,245 @@ def handle_game_input():
                 console_input.active = game_state.console_active
                 if not game_state.console_active:
                     console_input.text = ""
-                    console_input.txt_surface = small_font.render("", True, WHITE)
-            if game_state.console_active:
+                    console_input.txt_surface = render_text(small_font, "", WHITE)
+            elif game_state.console_active:
                 console_active, command = console_input.handle_event(event)
                 if event.key == pygame.K_RETURN and command:
-                    if command.lower() == "god":
+                    if game_state.peer and (command.lower() in ("god", "ainotarget") or command.lower().split()[:1] == ["tickrate"]):
+                        pass  # both sides must play the same match: no changes on one side only
+                    elif command.lower() == "god":
                         game_state.god_mode = not game_state.god_mode
                     elif command.lower() == "ainotarget":
                         game_state.ai_target_player = not game_state.ai_target_player
+                    elif command.lower() == "record":
+                        game_state.save_replays = not game_state.save_replays
+                    elif command.lower() == "timings":
+                        game_state.show_timings = not game_state.show_timings
+                    elif command.lower() == "timings csv":
+                        timer.write_csv(TIMINGS_CSV)
+                    elif command.lower().split()[:1] == ["profile"]:
+                        parts = command.split()
+                        if len(parts) != 2 or not parts[1].replace(".", "", 1).isdecimal() or float(parts[1]) <= 0:
+                            print("Usage: profile <seconds>")
+                        elif game_state.profile is None:
+                            game_state.profile = bot_worker.profile = ProfileCapture(float(parts[1]))
+                            game_state.profile.start()
+                    elif command.lower().split()[:1] == ["tickrate"]:
+                        parts = command.split()
+                        if len(parts) != 2 or not parts[1].isdecimal() or not 0 < int(parts[1]) <= tron_engine.MAX_TICK_RATE:
+                            print(f"Usage: tickrate <1-{tron_engine.MAX_TICK_RATE}>")
+                        else:
+                            game_state.tick_rate = int(parts[1])
                     console_input.text = ""
-                    console_input.txt_surface = small_font.render("", True, WHITE)
+                    console_input.txt_surface = render_text(small_font, "", WHITE)
             else:
-                if event.key == pygame.K_w and game_state.player1.dy != GRID_SIZE:
-                    game_state.player1.dx, game_state.player1.dy = 0, -GRID_SIZE
-                if event.key == pygame.K_s and game_state.player1.dy != -GRID_SIZE:
-                    game_state.player1.dx, game_state.player1.dy = 0, GRID_SIZE
-                if event.key == pygame.K_a and game_state.player1.dx != GRID_SIZE:
-                    game_state.player1.dx, game_state.player1.dy = -GRID_SIZE, 0
-                if event.key == pygame.K_d and game_state.player1.dx != -GRID_SIZE:
-                    game_state.player1.dx, game_state.player1.dy = GRID_SIZE, 0
+                if event.key == pygame.K_w:
+                    actions[0].append("up")
+                if event.key == pygame.K_s:
+                    actions[0].append("down")
+                if event.key == pygame.K_a:
+                    actions[0].append("left")
+                if event.key == pygame.K_d:
+                    actions[0].append("right")
                 if game_state.game_mode == "two_player":
-                    if event.key == pygame.K_UP and game_state.player2.dy != GRID_SIZE:
-                        game_state.player2.dx, game_state.player2.dy = 0, -GRID_SIZE
-                    if event.key == pygame.K_DOWN and game_state.player2.dy != -GRID_SIZE:
-                        game_state.player2.dx, game_state.player2.dy = 0, GRID_SIZE
-                    if event.key == pygame.K_LEFT and game_state.player2.dx != GRID_SIZE:
-                        game_state.player2.dx, game_state.player2.dy = -GRID_SIZE, 0
-                    if event.key == pygame.K_RIGHT and game_state.player2.dx != -GRID_SIZE:
-                        game_state.player2.dx, game_state.player2.dy = GRID_SIZE, 0
+                    if event.key == pygame.K_UP:
+                        actions[1].append("up")
+                    if event.key == pygame.K_DOWN:
+                        actions[1].append("down")
+                    if event.key == pygame.K_LEFT:
+                        actions[1].append("left")
+                    if event.key == pygame.K_RIGHT:
+                        actions[1].append("right")
+                if event.key == pygame.K_TAB:
+                    game_state.camera_target = (game_state.camera_target + 1) % len(game_state.players())
                 if event.key == pygame.K_r and game_state.game_over:
+                    if game_state.peer:
+                        # A network match ends the session; the menu is local play
+                        game_state.peer.close()
+                        game_state.peer = None
+                        tron_engine.set_arena(game_state, *ARENA)
                     reset_game()
                     game_state.state = "menu"
+    return actions
 
-def check_collision(player):
-    if player == game_state.player1 and game_state.god_mode:
-        return False
-    if player.x < 0 or player.x >= WIDTH or player.y < 0 or player.y >= HEIGHT:
-        return True
-    all_trails = game_state.player1.trail[:-1] + game_state.player2.trail[:-1]
-    if game_state.player3:
-        all_trails += game_state.player3.trail[:-1]
-    for segment in all_trails:
-        if (player.x, player.y) == segment:
-            return True
-    return False
+def draw_grid(surface):
+    surface.blit(background(surface.get_size(), GRID_SIZE, BLACK, GRID_COLOR), (0, 0))
 
-def draw_player(player):
-    pygame.draw.rect(screen, player.color, (player.x, player.y, GRID_SIZE, GRID_SIZE))
-    for x, y in player.trail:
-        pygame.draw.rect(screen, player.color, (x, y, GRID_SIZE, GRID_SIZE))
+trail_layer = TrailLayer((WIDTH, HEIGHT), GRID_SIZE, draw_grid)
 
-def draw_grid():
-    for x in range(0, WIDTH, GRID_SIZE):
-        pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, HEIGHT))
-    for y in range(0, HEIGHT, GRID_SIZE):
-        pygame.draw.line(screen, GRID_COLOR, (0, y), (WIDTH, y))
+def camera_position():
+    # Arena position shown at the window's top-left: the followed bike in the
+    # middle, but never past the arena's edges. On the classic arena it is (0, 0)
+    players = game_state.players()
+    target = players[game_state.camera_target % len(players)]
+    x = min(max(target.x - WIDTH // 2, 0), game_state.width - WIDTH)
+    y = min(max(target.y - HEIGHT // 2, 0), game_state.height - HEIGHT)
+    return x, y
+
+def draw_heads(alpha, camera=(0, 0)):
+    # Each head slides from the cell it left to the cell it is in as alpha
+    # goes from 0 to 1; the trail layer holds everything behind it
+    rects = []
+    view = screen.get_rect()
+    for player in game_state.players():
+        x, y = player.trail[-1]
+        px, py = player.trail[-2] if len(player.trail) > 1 else (x, y)
+        rect = pygame.Rect(round(px + (x - px) * alpha) - camera[0], round(py + (y - py) * alpha) - camera[1],
+                           GRID_SIZE, GRID_SIZE)
+        if view.colliderect(rect):
+            rects.append(pygame.draw.rect(screen, player.color, rect))
+    return rects
+
+def draw_timings():
+    # p50/p95/p99 per phase in the top-left corner, refreshed a few times a
+    # second so the numbers stay readable
+    now = time.perf_counter()
+    if not timing_overlay["lines"] or now - timing_overlay["refreshed"] > TIMINGS_REFRESH:
+        timing_overlay["refreshed"] = now
+        phases = list(timer.summary().items())
+        bots = sorted([entry for entry in phases if entry[0].startswith("ai_move ")], key=lambda e: e[1][3], reverse=True)
+        shown = [entry for entry in phases if not entry[0].startswith("ai_move ")] + bots[:TIMINGS_BOTS]
+        timing_overlay["lines"] = [f"{'ms':<20}{'p50':>7}{'p95':>7}{'p99':>7}"] + [
+            f"{phase[:20]:<20}{p50:>7.2f}{p95:>7.2f}{p99:>7.2f}"
+            for phase, (_, p50, p95, p99, _) in shown]
+        if len(bots) > TIMINGS_BOTS:
+            timing_overlay["lines"].append(f"{len(bots) - TIMINGS_BOTS} more bots in `timings csv`")
+        if bot_worker.active:
+            timing_overlay["lines"].append(bot_worker.report())
+    surfaces = [render_text(timing_font, line, WHITE) for line in timing_overlay["lines"]]
+    rect = pygame.Rect(5, 5, max(s.get_width() for s in surfaces) + 10, sum(s.get_height() for s in surfaces) + 10)
+    pygame.draw.rect(screen, BLACK, rect)
+    y = rect.y + 5
+    for surface in surfaces:
+        screen.blit(surface, (rect.x + 5, y))
+        y += surface.get_height()
+    return [rect]
 
 def draw_console():
     if game_state.console_active:
         pygame.draw.rect(screen, BLACK, (50, HEIGHT - 40, WIDTH - 100, 32))
         pygame.draw.rect(screen, WHITE, console_input.rect, 2)
         screen.blit(console_input.txt_surface, (console_input.rect.x + 5, console_input.rect.y + 5))
+        return [console_input.rect]
+    return []
 
 def reset_game():
-    game_state.player1 = Player(100, 300, GRID_SIZE, 0, BLUE, game_state.player1_name)
-    game_state.player2 = Player(700, 300, -GRID_SIZE, 0, RED, game_state.player2_name if game_state.game_mode == "two_player" else "AI 1")
-    if game_state.game_mode == "dual_ai":
-        game_state.player3 = Player(400, 100, 0, GRID_SIZE, GREEN, "AI 2")
-    else:
-        game_state.player3 = None
-    game_state.game_over = False
-    game_state.god_mode = False
-    game_state.ai_target_player = True
+    reset(game_state, game_state.player1_name, game_state.player2_name)
+    game_state.camera_target = 0
+    recorder.start(game_state)
+    bot_worker.start(game_state)
+
+def start_network_match(peer):
+    # Both sides reset from the host's seed so they start from the same state
+    names = [game_state.player1_name, game_state.player2_name]
+    names[1 - peer.index] = peer.other_name
+    game_state.peer = peer
+    game_state.game_mode = "two_player"
+    game_state.state = "game"
+    tron_engine.set_arena(game_state, WIDTH, HEIGHT)
+    reset(game_state, names[0], names[1], seed=peer.seed)
+    game_state.camera_target = peer.index
+    game_state.tick_rate = peer.tick_rate
+    recorder.start(game_state)
+    bot_worker.start(game_state)  # no bots over the network: this just stands the worker down
+
+def save_replay():
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    path = os.path.join(REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + ".trr")
+    recorder.replay.save(path)
+    recorder.replay = None
+    print(f"Replay written to {path}")
 
 async def main():
     def setup():
         pass  # Pygame initialized above
 
+    overlay_rects = []  # Screen areas the heads, banner and console covered last frame
+    pending = {0: [], 1: []}  # Commands waiting for the next tick
+    timestep = FixedTimestep(game_state.tick_rate)
+
     def update_loop():
+        if game_state.profile and game_state.profile.poll():
+            print(f"Profile written to {' and '.join(game_state.profile.paths())}")
+            game_state.profile = bot_worker.profile = None
         if game_state.state in ["menu", "ai_difficulty"]:
             handle_menu_input()
             draw_menu()
+            pygame.display.flip()
+            timestep.reset()
+            for commands in pending.values():
+                commands.clear()
         elif game_state.state == "game":
-            handle_game_input()
-            if game_state.game_mode in ["ai", "dual_ai"] and not game_state.game_over:
-                ai_move(game_state.player2, is_ai1=True)
-                if game_state.player3:
-                    ai_move(game_state.player3, is_ai1=False)
-            if not game_state.game_over:
-                game_state.player1.x += game_state.player1.dx
-                game_state.player1.y += game_state.player1.dy
-                game_state.player2.x += game_state.player2.dx
-                game_state.player2.y += game_state.player2.dy
-                game_state.player1.trail.append((game_state.player1.x, game_state.player1.y))
-                game_state.player2.trail.append((game_state.player2.x, game_state.player2.y))
-                if game_state.player3:
-                    game_state.player3.x += game_state.player3.dx
-                    game_state.player3.y += game_state.player3.dy
-                    game_state.player3.trail.append((game_state.player3.x, game_state.player3.y))
-                if (check_collision(game_state.player1) or 
-                    check_collision(game_state.player2) or 
-                    (game_state.player3 and check_collision(game_state.player3))):
+            timer.start()
+            for index, commands in handle_game_input().items():
+                pending[index].extend(commands)
+            timer.mark("input")
+            # Run however many ticks are due; a key pressed between ticks is
+            # applied by the next one, so the ticks do not depend on frame timing
+            for _ in range(timestep.advance(game_state.tick_rate)):
+                actions = pending
+                if game_state.peer:
+                    # Only this side's keys count; the other bike comes over the network
+                    actions = game_state.peer.exchange(pending[0])
+                    if actions is None:
+                        break  # waiting for the other side's input
+                step(game_state, actions, timer, bot_worker.decisions(game_state, timer))
+                if game_state.peer:
+                    game_state.peer.confirm(game_state)
+                    if game_state.peer.desync is not None:
+                        break
+                recorder.record(game_state)
+                bot_worker.post(game_state)
+                for commands in pending.values():
+                    commands.clear()
+            if game_state.peer:
+                game_state.peer.idle()
+                if game_state.peer.desync is not None and not game_state.game_over:
+                    # The two simulations differ: end the match rather than play on
                     game_state.game_over = True
-            screen.fill(BLACK)
-            draw_grid()
-            draw_player(game_state.player1)
-            draw_player(game_state.player2)
-            if game_state.player3:
-                draw_player(game_state.player3)
+                    recorder.replay = None
+            if game_state.game_over and game_state.save_replays and recorder.replay:
+                save_replay()
+            alpha = 1.0 if game_state.game_over else timestep.alpha()
+            # Only new trail cells and the overlays are copied to the screen
+            # (all of it when the camera has moved)
+            camera = camera_position()
+            dirty = trail_layer.update(game_state.players(), lag=1, arena=(game_state.width, game_state.height),
+                                       camera=camera) + overlay_rects
+            trail_layer.restore(screen, dirty)
+            timer.mark("draw trails")
+            overlay_rects.clear()
+            overlay_rects.extend(draw_heads(alpha, camera))
+            timer.mark("draw heads")
             if game_state.game_over:
-                winners = []
-                if not check_collision(game_state.player1):
-                    winners.append(game_state.player1.name)
-                if not check_collision(game_state.player2):
-                    winners.append(game_state.player2.name)
-                if game_state.player3 and not check_collision(game_state.player3):
-                    winners.append(game_state.player3.name)
-                winner_text = "No one" if not winners else " and ".join(winners)
-                text = font.render(f"Game Over! {winner_text} wins! Press R to Restart", True, WHITE)
+                if game_state.peer and game_state.peer.desync is not None:
+                    message = f"Out of sync with {game_state.peer.other_name} at tick {game_state.peer.desync}! Press R"
+                else:
+                    winners = game_state.winners
+                    winner_text = "No one" if not winners else " and ".join(winners)
+                    message = f"Game Over! {winner_text} wins! Press R to Restart"
+                text = render_text(font, message, WHITE)
                 text_rect = text.get_rect(center=(WIDTH//2, HEIGHT//2))
                 screen.blit(text, text_rect)
-            draw_console()
-        pygame.display.flip()
+                overlay_rects.append(text_rect)
+                timer.mark("draw banner")
+            overlay_rects.extend(draw_console())
+            timer.mark("draw console")
+            if game_state.show_timings:
+                overlay_rects.extend(draw_timings())
+                timer.mark("draw timings")
+            pygame.display.update(dirty + overlay_rects)
+            timer.end_frame()
 
     setup()
+    peer = await tron_net.from_args(sys.argv[1:], game_state.player1_name, game_state.player2_name)
+    if peer:
+        start_network_match(peer)
+    next_frame = time.perf_counter()
     while True:
         update_loop()
-        await asyncio.sleep(1.0 / FPS)
+        next_frame = max(next_frame + 1.0 / RENDER_FPS, time.perf_counter())
+        await asyncio.sleep(next_frame - time.perf_counter())
 
 if platform.system() == "Emscripten":
     asyncio.ensure_future(main())
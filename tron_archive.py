@@ -0,0 +1,181 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+import numpy as np
+import tron_engine
+from tron_replay import Replay, ReplayRecorder
+
+# Append-only replay archive for large numbers of matches.
+#
+# <path>.trd holds the replay payloads back to back and is read through an
+# mmap, so opening a replay decodes straight out of the page cache without
+# copying the payload. <path>.tri is a fixed-width index with one record
+# per match. Queries run on a NumPy memmap of the index alone, so filtering
+# millions of matches by mode, difficulty, winner or length never touches
+# the payloads. Appends write the payload first and the index record last,
+# so an interrupted append leaves no index entry pointing at half a replay.
+
+INDEX_MAGIC = b"TRNX"
+INDEX_VERSION = 2
+INDEX_HEADER = 16
+MODES = ["", "two_player", "ai", "dual_ai", "ffa"]
+DIFFICULTIES = ["", "easy", "medium", "hard", "extreme", "insane", "mcts"]
+
+# winner is the survivors bitmask: bit i set when bike i (position in
+# state.players()) was still alive at game over, 64 bits like the replay's
+# own mask so every free-for-all bike (tron_engine.MAX_BIKES) fits
+INDEX_DTYPE = np.dtype([("match_id", "<u8"), ("offset", "<u8"), ("size", "<u4"), ("length", "<u4"),
+                        ("winner", "<u8"), ("mode", "u1"), ("ai_difficulty", "u1"), ("bikes", "u1")])
+
+class ReplayArchive:
+    def __init__(self, path):
+        self.data_path = path + ".trd"
+        self.index_path = path + ".tri"
+        if not os.path.exists(self.index_path):
+            with open(self.index_path, "wb") as f:
+                f.write(struct.pack("<4sHH8x", INDEX_MAGIC, INDEX_VERSION, INDEX_DTYPE.itemsize))
+            open(self.data_path, "ab").close()
+        with open(self.index_path, "rb") as f:
+            magic, version, itemsize = struct.unpack("<4sHH8x", f.read(INDEX_HEADER))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or itemsize != INDEX_DTYPE.itemsize:
+            raise ValueError(f"{self.index_path} is not a version {INDEX_VERSION} replay index")
+        self.data_map = None
+        self.mapped_size = 0
+
+    def __len__(self):
+        return (os.path.getsize(self.index_path) - INDEX_HEADER) // INDEX_DTYPE.itemsize
+
+    def append(self, replay, match_id=None):
+        payload = replay.to_bytes()
+        if match_id is None:
+            match_id = len(self)
+        with open(self.data_path, "ab") as data:
+            offset = data.tell()
+            data.write(payload)
+        record = np.zeros(1, INDEX_DTYPE)
+        record["match_id"] = match_id
+        record["offset"] = offset
+        record["size"] = len(payload)
+        record["length"] = replay.length
+        record["mode"] = MODES.index(replay.game_mode)
+        record["ai_difficulty"] = DIFFICULTIES.index(replay.ai_difficulty)
+        record["winner"] = sum(1 << i for i, alive in enumerate(replay.survivors) if alive)
+        record["bikes"] = len(replay.names)
+        with open(self.index_path, "ab") as index:
+            index.write(record.tobytes())
+        return match_id
+
+    def index(self):
+        # The whole index as a read-only structured array backed by the file
+        if not len(self):
+            return np.zeros(0, INDEX_DTYPE)
+        return np.memmap(self.index_path, INDEX_DTYPE, "r", offset=INDEX_HEADER, shape=(len(self),))
+
+    def query(self, mode=None, ai_difficulty=None, winner=None, min_length=None, max_length=None):
+        # Index records matching every filter given. winner is a bike index:
+        # that bike was among those still standing when the match ended.
+        index = self.index()
+        keep = np.ones(len(index), dtype=bool)
+        if mode is not None:
+            keep &= index["mode"] == MODES.index(mode)
+        if ai_difficulty is not None:
+            keep &= index["ai_difficulty"] == DIFFICULTIES.index(ai_difficulty)
+        if winner is not None:
+            if not 0 <= winner < tron_engine.MAX_BIKES:
+                raise ValueError(f"winner must be a bike index from 0 to {tron_engine.MAX_BIKES - 1}")
+            keep &= (index["winner"] & np.uint64(1 << winner)) != 0
+        if min_length is not None:
+            keep &= index["length"] >= min_length
+        if max_length is not None:
+            keep &= index["length"] <= max_length
+        return index[keep]
+
+    def payload(self, record):
+        # The replay's bytes as a memoryview into the mmap, no copy made
+        end = int(record["offset"]) + int(record["size"])
+        if end > self.mapped_size:
+            # Written after the last mapping (or never mapped): map it again
+            self.close()
+            with open(self.data_path, "rb") as data:
+                self.data_map = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped_size = len(self.data_map)
+        return memoryview(self.data_map)[int(record["offset"]):end]
+
+    def open(self, record):
+        view = self.payload(record)
+        try:
+            return Replay.from_bytes(view)
+        finally:
+            view.release()
+
+    def find(self, match_id):
+        index = self.index()
+        rows = np.flatnonzero(index["match_id"] == match_id)
+        return index[rows[0]] if len(rows) else None
+
+    def close(self):
+        if self.data_map is not None:
+            self.data_map.close()
+            self.data_map = None
+            self.mapped_size = 0
+
+def record_match(seed, difficulty, game_mode="dual_ai"):
+    state = tron_engine.GameState(seed=seed)
+    state.game_mode = game_mode
+    state.ai_difficulty = difficulty
+    tron_engine.reset(state, seed=seed)
+    state.player1.ai_difficulty = difficulty
+    recorder = ReplayRecorder()
+    recorder.start(state)
+    while not state.game_over and state.tick < 10000:
+        tron_engine.step(state)
+        recorder.record(state)
+    return recorder.replay
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query a replay archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="record bot matches into the archive")
+    build.add_argument("archive")
+    build.add_argument("--difficulties", nargs="+", default=["medium", "hard", "extreme"])
+    build.add_argument("--modes", nargs="+", default=["ai", "dual_ai"], choices=["ai", "dual_ai"])
+    build.add_argument("--matches", type=int, default=20, help="matches per difficulty and mode")
+    build.add_argument("--seed", type=int, default=0)
+    query = sub.add_parser("query", help="list matches from the index")
+    query.add_argument("archive")
+    query.add_argument("--mode", choices=MODES[1:])
+    query.add_argument("--difficulty", choices=DIFFICULTIES[1:])
+    query.add_argument("--winner", type=int, help="bike index among the survivors (0 = Player 1, 2 = AI 2)")
+    query.add_argument("--min-length", type=int)
+    query.add_argument("--max-length", type=int)
+    query.add_argument("--show", type=int, default=10, help="matches to print")
+    args = parser.parse_args()
+    if args.command == "query" and args.winner is not None and not 0 <= args.winner < tron_engine.MAX_BIKES:
+        parser.error(f"--winner must be a bike index from 0 to {tron_engine.MAX_BIKES - 1}")
+
+    archive = ReplayArchive(args.archive)
+    if args.command == "build":
+        start = time.perf_counter()
+        added = 0
+        for mode in args.modes:
+            for difficulty in args.difficulties:
+                for seed in range(args.seed, args.seed + args.matches):
+                    archive.append(record_match(seed, difficulty, mode))
+                    added += 1
+        print(f"{added} matches added in {time.perf_counter() - start:.1f}s, "
+              f"{len(archive)} in {args.archive}, {os.path.getsize(archive.data_path)} bytes of replays")
+    else:
+        start = time.perf_counter()
+        found = archive.query(args.mode, args.difficulty, args.winner, args.min_length, args.max_length)
+        elapsed = time.perf_counter() - start
+        print(f"{len(found)} of {len(archive)} matches in {elapsed * 1000:.1f} ms")
+        for record in found[:args.show]:
+            replay = archive.open(record)
+            print(f"  match {record['match_id']}: {replay.game_mode} {replay.ai_difficulty}, "
+                  f"{replay.length} ticks, winners {replay.winners}")
+    archive.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import sys
+import time
+import numpy as np
+from tron_engine import WIDTH, HEIGHT, GRID_SIZE, spawn_points
+import tron_engine
+
+# Batch simulator: K bot-only matches held as stacked NumPy arrays and
+# advanced together, one vectorized tick at a time. It plays by the same
+# rules as tron_engine (ray lookahead, the 50 - min_dist trap bonus, the
+# trail[:-1] collision rule, head-on crashes), so a batch match ends
+# exactly like the same seed played through tron_engine.step with bots on
+# every bike and the hard/extreme territory evaluation switched off;
+# python tron_batch.py parity 160x120 checks that on a given arena size.
+
+# Heading indices match tron_engine.DIRECTIONS: right, left, up, down
+DX = np.array([1, -1, 0, 0])
+DY = np.array([0, 0, -1, 1])
+
+# (max_steps if is_ai1, max_steps otherwise, traps when is_ai1, traps otherwise)
+AI_SETTINGS = {
+    "easy": (20, 10, False, True),
+    "medium": (30, 15, False, True),
+    "hard": (40, 20, True, True),
+    "extreme": (60, 30, True, True),
+}
+
+class BatchState:
+    def __init__(self, seeds, difficulties=("hard", "hard", "hard"), is_ai1=(True, True, False),
+                 width=WIDTH, height=HEIGHT, ai_target_player=True):
+        # seeds: one per match, fed to tron_engine.spawn_points.
+        # difficulties: one entry per bike, either a name or a list of names
+        # (one per match); two bikes plays "ai" mode, three plays "dual_ai".
+        self.matches = len(seeds)
+        self.bikes = len(difficulties)
+        self.cols = width // GRID_SIZE
+        self.rows = height // GRID_SIZE
+        # The arena gets a one-cell wall border so rays and moves never need
+        # a bounds check
+        self.stride = self.cols + 2
+        self.cells = self.stride * (self.rows + 2)
+        self.offsets = np.array([1, -1, -self.stride, self.stride])
+        grid = np.zeros((self.matches, self.rows + 2, self.stride), dtype=bool)
+        grid[:, 0, :] = True
+        grid[:, -1, :] = True
+        grid[:, :, 0] = True
+        grid[:, :, -1] = True
+        # Solid margins before the first and after the last match let a ray
+        # gather run past its wall without clipping indices
+        self.margin = max(AI_SETTINGS["extreme"][:2]) * self.stride
+        self.grid = np.ones(self.matches * self.cells + 2 * self.margin, dtype=bool)
+        self.grid[self.margin:-self.margin] = grid.reshape(-1)
+        index = np.int32 if len(self.grid) < 2 ** 31 else np.int64
+
+        self.max_steps = np.zeros((self.matches, self.bikes), dtype=np.int64)
+        self.trap_weight = np.zeros((self.matches, self.bikes))
+        for b, difficulty in enumerate(difficulties):
+            names = [difficulty] * self.matches if isinstance(difficulty, str) else difficulty
+            settings = np.array([AI_SETTINGS[name] for name in names])
+            column = 0 if is_ai1[b] else 1
+            self.max_steps[:, b] = settings[:, column]
+            traps = settings[:, 2 + column].astype(bool) & ai_target_player
+            self.trap_weight[:, b] = np.where(traps, 0.1 if is_ai1[b] else 0.3, 0.0)
+
+        headings = [0, 1, 3]  # right, left, down: the engine's starting headings
+        self.heads = np.zeros((self.matches, self.bikes), dtype=index)
+        self.dirs = np.tile(np.array(headings[:self.bikes]), (self.matches, 1))
+        for k, seed in enumerate(seeds):
+            for b, (x, y) in enumerate(spawn_points(seed, self.cols * GRID_SIZE, self.rows * GRID_SIZE)[:self.bikes]):
+                # A head outside the arena would index into the next match's board
+                if not (0 <= x < self.cols * GRID_SIZE and 0 <= y < self.rows * GRID_SIZE):
+                    raise ValueError(f"spawn ({x}, {y}) of match {k} is outside a {width}x{height} arena")
+                self.heads[k, b] = (y // GRID_SIZE + 1) * self.stride + x // GRID_SIZE + 1
+        self.base = self.margin + np.arange(self.matches, dtype=index) * self.cells
+        self.offsets = self.offsets.astype(index)
+
+        # Per-match results, filled in as matches finish
+        self.length = np.zeros(self.matches, dtype=np.int64)
+        self.alive = np.ones((self.matches, self.bikes), dtype=bool)
+        self.done = np.zeros(self.matches, dtype=bool)
+        self.tick = 0
+        # Rows still being played; finished matches are dropped from these
+        self.active = np.arange(self.matches)
+
+    def ai_move(self):
+        act = self.active
+        base = self.base[act]
+        heads = self.heads[act]
+        dirs = self.dirs[act]
+        xs = heads % self.stride
+        ys = heads // self.stride
+        new_dirs = dirs.copy()
+        for b in range(self.bikes):
+            max_steps = self.max_steps[act, b]
+            reach = np.arange(int(max_steps.max()), dtype=heads.dtype)
+            weight = self.trap_weight[act, b]
+            best = np.full(len(act), -np.inf)
+            rows = np.arange(len(act))
+            for d in range(4):
+                cand = base + heads[:, b] + self.offsets[d]
+                safe = (dirs[:, b] != (d ^ 1)) & ~self.grid[cand]
+                blocked = self.grid[cand[:, None] + reach * self.offsets[d]]
+                first = blocked.argmax(axis=1)
+                steps = np.where(blocked[rows, first], first, len(reach))
+                score = np.minimum(steps, max_steps).astype(float)
+                if weight.any():
+                    min_dist = np.full(len(act), np.inf)
+                    for t in range(self.bikes):
+                        if t != b:
+                            px = (xs[:, t] - xs[:, b] - DX[d]) * GRID_SIZE
+                            py = (ys[:, t] - ys[:, b] - DY[d]) * GRID_SIZE
+                            min_dist = np.minimum(min_dist, np.sqrt(px * px + py * py))
+                    score = score + np.maximum(0, 50 - min_dist) * weight
+                # Strictly better only, so ties keep the earlier direction
+                better = safe & (score > best)
+                best = np.where(better, score, best)
+                new_dirs[:, b] = np.where(better, d, new_dirs[:, b])
+        self.dirs[act] = new_dirs
+
+    def step(self):
+        act = self.active
+        if not len(act):
+            return
+        self.ai_move()
+        base = self.base[act]
+        heads = self.heads[act]
+        # Old heads turn into trail, then every bike moves one cell
+        self.grid[base[:, None] + heads] = True
+        heads = heads + self.offsets[self.dirs[act]]
+        self.heads[act] = heads
+        self.tick += 1
+        crashed = self.grid[base[:, None] + heads]
+        for b in range(self.bikes):
+            for t in range(b + 1, self.bikes):
+                head_on = heads[:, b] == heads[:, t]
+                crashed[:, b] |= head_on
+                crashed[:, t] |= head_on
+        over = crashed.any(axis=1)
+        if over.any():
+            finished = act[over]
+            self.alive[finished] = ~crashed[over]
+            self.length[finished] = self.tick
+            self.done[finished] = True
+            self.active = act[~over]
+
+    def run(self, max_ticks=10000):
+        while len(self.active) and self.tick < max_ticks:
+            self.step()
+        self.length[self.active] = self.tick
+        return self
+
+    def winners(self, k):
+        names = ["Player 1", "AI 1", "AI 2"]
+        return [names[b] for b in range(self.bikes) if self.alive[k, b]] if self.done[k] else []
+
+def engine_match(seed, difficulties=("hard", "hard", "hard"), is_ai1=(True, True, False),
+                 width=WIDTH, height=HEIGHT):
+    # The same match played one tick at a time through tron_engine
+    state = tron_engine.GameState(width, height, seed=seed)
+    state.game_mode = "dual_ai" if len(difficulties) == 3 else "ai"
+    tron_engine.reset(state, seed=seed)
+    state.use_territory = False
+    for player, difficulty, flag in zip(state.players(), difficulties, is_ai1):
+        player.ai_difficulty = difficulty
+        player.is_ai1 = flag
+    return tron_engine.play_match(state)
+
+def parity(width, height, matches, difficulty="hard"):
+    # Seeds whose batch match ends differently from tron_engine's
+    batch = BatchState(range(matches), (difficulty,) * 3, width=width, height=height).run()
+    differ = []
+    for seed in range(matches):
+        state = engine_match(seed, (difficulty,) * 3, width=width, height=height)
+        if (state.tick, state.winners) != (batch.length[seed], batch.winners(seed)):
+            differ.append(seed)
+    return differ
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["parity"]:
+        # python tron_batch.py parity [<cols>x<rows>] [<matches>]: check that
+        # batch matches end like the engine's on that arena
+        cols, rows = map(int, (sys.argv[2] if len(sys.argv) > 2 else "160x120").split("x"))
+        matches = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+        differ = parity(cols * GRID_SIZE, rows * GRID_SIZE, matches)
+        print(f"{cols}x{rows}: {matches - len(differ)} of {matches} matches end as on the engine"
+              + (f"; seeds {differ} differ" if differ else ""))
+        sys.exit(1 if differ else 0)
+    difficulty = sys.argv[1] if len(sys.argv) > 1 else "hard"
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    start = time.perf_counter()
+    batch = BatchState(range(matches), (difficulty,) * 3).run()
+    elapsed = time.perf_counter() - start
+    print(f"{matches} {difficulty} matches, {batch.length.sum()} ticks in {elapsed:.2f}s "
+          f"({matches / elapsed:.0f} matches/s)")
+    wins = batch.alive[batch.done].sum(axis=0)
+    print("wins per bike:", dict(zip(["Player 1", "AI 1", "AI 2"], wins.tolist())),
+          "mean length:", round(float(batch.length.mean()), 1))
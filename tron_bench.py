@@ -0,0 +1,201 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from tron_engine import GRID_SIZE, ai_move, check_collision, reset, step
+import tron_engine
+from tron_render import TrailLayer, background
+
+# Benchmarks for the per-tick hot paths on synthetic boards: a fixed share
+# of the arena is filled with trail cells (split between the bikes) and the
+# bikes sit in small clearings at their usual spawns. Results are ns per
+# operation, written as JSON and compared with a baseline; anything slower
+# than the baseline by more than --tolerance is reported and the run exits
+# with status 1.
+#
+#   python tron_bench.py                      compare with tron_bench_baseline.json
+#   python tron_bench.py --save-baseline      record a new baseline on this machine
+#
+# Timings only mean something against a baseline taken on the same machine,
+# so none is kept in the repository: the first run records one, and it has
+# to be re-recorded whenever the code it measures is deliberately changed.
+
+BASELINE = "tron_bench_baseline.json"
+BOARDS = [(80, 60, 0.1), (80, 60, 0.5), (80, 60, 0.9), (160, 120, 0.1), (160, 120, 0.5), (160, 120, 0.9)]
+AI_DIFFICULTIES = ["easy", "medium", "hard", "extreme"]
+CLEARING = 2  # cells kept free around each spawn
+TICK_BURST = 20  # ticks played from each fresh copy of the board in the tick benchmark
+REPEATS = 5
+TOLERANCE = 0.3
+
+def board_name(cols, rows, fill):
+    return f"{cols}x{rows}@{round(fill * 100)}%"
+
+def synthetic_board(cols, rows, fill, seed=0):
+    state = tron_engine.GameState(cols * GRID_SIZE, rows * GRID_SIZE, seed=seed)
+    state.game_mode = "dual_ai"
+    state.ai_difficulty = "hard"
+    reset(state, seed=seed)
+    state.player1.ai_difficulty = "hard"
+    players = state.players()
+    heads = [(p.x // GRID_SIZE, p.y // GRID_SIZE) for p in players]
+    cells = [(x, y) for y in range(rows) for x in range(cols)
+             if all(abs(x - hx) > CLEARING or abs(y - hy) > CLEARING for hx, hy in heads)]
+    rng = random.Random(seed)
+    filled = rng.sample(cells, min(len(cells), round(fill * cols * rows)))
+    for i, player in enumerate(players):
+        player.trail = [(x * GRID_SIZE, y * GRID_SIZE) for x, y in filled[i::len(players)]] + player.trail
+        for x, y in player.trail[:-1]:
+            tron_engine.occupy(state, x, y)
+    return state
+
+def run(fn, number):
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        fn()
+    return time.perf_counter_ns() - start
+
+def time_op(fn, min_time):
+    # ns per call: the best of REPEATS rounds, each long enough to last
+    # about min_time seconds
+    number = 1
+    while True:
+        elapsed = run(fn, number)
+        if elapsed >= min_time * 1e9:
+            break
+        number = max(number * 2, int(number * min_time * 1e9 / max(elapsed, 1)))
+    best = min([elapsed] + [run(fn, number) for _ in range(REPEATS - 1)])
+    return best / number
+
+def time_ticks(template, min_time):
+    # ns per tick of step plus the incremental redraw a front-end does,
+    # played in bursts from fresh copies of the board so it never runs out
+    screen = pygame.Surface((template.width, template.height))
+    best = None
+    for _ in range(REPEATS):
+        ticks = elapsed = 0
+        while elapsed < min_time * 1e9:
+            state = copy.deepcopy(template)
+            layer = TrailLayer(screen.get_size(), GRID_SIZE, draw_background)
+            layer.update(state.players(), lag=1)
+            start = time.perf_counter_ns()
+            for _ in range(TICK_BURST):
+                step(state)
+                layer.restore(screen, layer.update(state.players(), lag=1))
+                for player in state.players():
+                    x, y = player.trail[-1]
+                    pygame.draw.rect(screen, player.color, (x, y, GRID_SIZE, GRID_SIZE))
+                ticks += 1
+                if state.game_over:
+                    break
+            elapsed += time.perf_counter_ns() - start
+        best = min(best, elapsed / ticks) if best else elapsed / ticks
+    return best
+
+def draw_background(surface):
+    surface.blit(background(surface.get_size(), GRID_SIZE, (0, 0, 0), (50, 50, 50)), (0, 0))
+
+def bench_board(cols, rows, fill, min_time):
+    state = synthetic_board(cols, rows, fill)
+    players = state.players()
+    results = {}
+    results["check_collision"] = time_op(lambda: [check_collision(state, p) for p in players], min_time) / len(players)
+    for difficulty in AI_DIFFICULTIES:
+        player = state.player2
+        player.ai_difficulty = difficulty
+        ai_move(state, player)  # builds the territory labels once, as the first real tick does
+        dx, dy = player.dx, player.dy
+
+        def decide():
+            player.dx, player.dy = dx, dy
+            ai_move(state, player)
+        results["ai_move:" + difficulty] = time_op(decide, min_time)
+    state.player2.ai_difficulty = "hard"
+
+    # Every trail cell drawn from scratch: what a frame cost before the trail layer
+    layer = TrailLayer((state.width, state.height), GRID_SIZE, draw_background)
+
+    def draw_trails():
+        layer.players = []
+        layer.update(players)
+    results["draw_trails"] = time_op(draw_trails, min_time)
+    results["tick"] = time_ticks(synthetic_board(cols, rows, fill), min_time)
+    return results
+
+def measure(boards, min_time):
+    timings = {}
+    for cols, rows, fill in boards:
+        for op, ns in bench_board(cols, rows, fill, min_time).items():
+            timings[f"{board_name(cols, rows, fill)}/{op}"] = ns
+    return timings
+
+def slower(timings, baseline, tolerance):
+    return {name for name, ns in timings.items()
+            if name in baseline and ns > baseline[name]["ns_per_op"] * (1 + tolerance)}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, entry in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = entry["ns_per_op"] / old["ns_per_op"]
+        entry["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append((name, old["ns_per_op"], entry["ns_per_op"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine and render hot paths")
+    parser.add_argument("--out", default="tron_bench_results.json", help="where to write this run's results")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per timing round")
+    parser.add_argument("--boards", nargs="+", help="only these boards, e.g. 80x60@50%%")
+    args = parser.parse_args()
+
+    machine = f"{platform.node()} {platform.machine()} {platform.processor()}".strip()
+    boards = [b for b in BOARDS if not args.boards or board_name(*b) in args.boards]
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored["results"]
+        if stored.get("machine") != machine:
+            print(f"warning: {args.baseline} was recorded on {stored.get('machine', 'another machine')}; "
+                  "run with --save-baseline to record one here")
+    save = args.save_baseline or not os.path.exists(args.baseline)
+    timings = measure(boards, args.min_time)
+    # Boards that look slower are timed once more before anything fails: on
+    # a busy machine one slow round is usually somebody else's process
+    suspects = {name.split("/")[0] for name in slower(timings, baseline, args.tolerance)}
+    for name, ns in measure([b for b in boards if board_name(*b) in suspects], args.min_time).items():
+        timings[name] = min(timings[name], ns)
+    results = {name: {"ns_per_op": round(ns), "ops_per_sec": round(1e9 / ns, 1)} for name, ns in timings.items()}
+    regressions = compare(results, baseline, args.tolerance)
+
+    print(f"{'benchmark':<36}{'ns/op':>12}{'ops/s':>12}{'vs base':>9}")
+    for name, entry in results.items():
+        ratio = f"{entry['vs_baseline']:.2f}x" if "vs_baseline" in entry else "-"
+        print(f"{name:<36}{entry['ns_per_op']:>12}{entry['ops_per_sec']:>12.0f}{ratio:>9}")
+    report = {"machine": machine, "python": sys.version.split()[0], "pygame": pygame.version.ver, "results": results}
+    with open(args.baseline if save else args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    if save:
+        print(f"baseline saved to {args.baseline}")
+    if regressions:
+        print(f"\nREGRESSION: {len(regressions)} benchmark(s) more than {args.tolerance:.0%} slower than the baseline")
+        for name, old, new, ratio in regressions:
+            print(f"  {name}: {old} -> {new} ns/op ({ratio:.2f}x)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import time
+import zlib
+import tron_engine
+from tron_engine import DIRECTIONS, GRID_SIZE, reset, step
+
+# Spectator broadcast: one process plays bot matches and streams them to any
+# number of viewers over TCP.
+#
+# A viewer that connects gets a snapshot (names, colours, heads and the
+# zlib'd owner of every cell) and from then on one small delta per tick: a
+# byte per bike with its heading, boost and alive bits and the number of
+# cells it swept, from which the viewer works out the new cells itself. Each delta is encoded once and
+# the same bytes are handed to every viewer's transport without waiting on
+# any of them. A viewer whose unsent backlog goes over HIGH_WATER is skipped
+# until it has drained below LOW_WATER and then gets a fresh snapshot, so a
+# slow viewer only ever costs its own stream.
+#
+#   python tron_broadcast.py serve --port 7777
+#   python tron_broadcast.py watch 127.0.0.1:7777
+#   python tron_broadcast.py selftest --viewers 1000
+
+SNAPSHOT, DELTA = 1, 2
+HIGH_WATER = 64 * 1024  # bytes queued for one viewer before it is skipped
+LOW_WATER = 8 * 1024  # ...and the backlog it must drain to before a resync
+MATCH_GAP = 20  # ticks the finished board stays up before the next match
+HEADING, BOOST, ALIVE = 3, 4, 8
+SWEPT_SHIFT = 4  # the top four bits of a bike's delta byte: cells moved this tick
+
+def message(payload):
+    return struct.pack("<I", len(payload)) + payload
+
+def pack_str(text):
+    data = text.encode()[:255]
+    return bytes([len(data)]) + data
+
+def owner_grid(state):
+    # 0 for a free cell, otherwise 1 + the index of the bike that got there
+    # first; a head that crashed into a trail leaves the cell to the trail
+    owner = bytearray(state.cols * state.rows)
+    players = state.players()
+    for i, player in enumerate(players):
+        for x, y in player.trail[:-1]:
+            cell = y // GRID_SIZE * state.cols + x // GRID_SIZE
+            owner[cell] = owner[cell] or i + 1
+    for i, player in enumerate(players):
+        x, y = player.trail[-1]
+        if 0 <= x < state.width and 0 <= y < state.height:
+            cell = y // GRID_SIZE * state.cols + x // GRID_SIZE
+            owner[cell] = owner[cell] or i + 1
+    return owner
+
+def bike_flags(player):
+    return (DIRECTIONS.index((player.dx, player.dy)) | BOOST * player.boost_active | ALIVE * player.alive)
+
+def encode_snapshot(state):
+    players = state.players()
+    out = [struct.pack("<BIHHB?", SNAPSHOT, state.tick, state.cols, state.rows, len(players), state.game_over)]
+    for player in players:
+        out += [pack_str(player.name), struct.pack("<BBBhhB", *player.color, player.x, player.y, bike_flags(player))]
+    out.append(zlib.compress(bytes(owner_grid(state))))
+    return message(b"".join(out))
+
+def encode_delta(state, swept):
+    flags = bytes(bike_flags(p) | cells << SWEPT_SHIFT for p, cells in zip(state.players(), swept))
+    return message(struct.pack("<BI", DELTA, state.tick) + flags)
+
+class Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.transport = writer.transport
+        self.needs_snapshot = True
+        self.skipped = 0
+        self.resyncs = 0
+
+class BroadcastServer:
+    def __init__(self, difficulty="hard", tick_rate=tron_engine.FPS, seed=0):
+        self.difficulty = difficulty
+        self.tick_rate = tick_rate
+        self.seed = seed
+        self.viewers = set()
+        self.state = None
+        self.high_water = HIGH_WATER
+        self.low_water = LOW_WATER
+        self.send_buffer = None  # SO_SNDBUF for viewer sockets; small keeps the kernel from hiding a backlog
+        self.lateness = 0.0  # worst delay of a tick behind its schedule, in seconds
+        self.busy = 0.0  # worst time spent stepping and broadcasting one tick
+        self.bytes_queued = 0
+        self.new_match()
+
+    def new_match(self):
+        state = tron_engine.GameState(seed=self.seed)
+        state.game_mode = "dual_ai"
+        state.ai_difficulty = self.difficulty
+        reset(state, seed=self.seed)
+        state.player1.ai_difficulty = self.difficulty
+        state.tick_rate = self.tick_rate
+        self.state = state
+        self.seed += 1
+        self.over_for = 0
+        for viewer in self.viewers:
+            viewer.needs_snapshot = True
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self.connected, host, port, backlog=1024)
+
+    async def connected(self, reader, writer):
+        if self.send_buffer:
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        viewer = Viewer(writer)
+        self.viewers.add(viewer)
+        try:
+            # Viewers never send anything; reading just notices them leaving
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            writer.close()
+
+    def broadcast(self, delta):
+        snapshot = None
+        for viewer in list(self.viewers):
+            if viewer.transport.is_closing():
+                self.viewers.discard(viewer)
+                continue
+            backlog = viewer.transport.get_write_buffer_size()
+            if backlog > self.high_water:
+                viewer.needs_snapshot = True
+            if viewer.needs_snapshot:
+                if backlog > self.low_water:
+                    viewer.skipped += 1
+                    continue
+                if snapshot is None:
+                    snapshot = encode_snapshot(self.state)
+                viewer.transport.write(snapshot)
+                viewer.needs_snapshot = False
+                viewer.resyncs += 1
+                self.bytes_queued += len(snapshot)
+            elif delta:
+                viewer.transport.write(delta)
+                self.bytes_queued += len(delta)
+
+    def tick(self):
+        state = self.state
+        if state.game_over:
+            self.over_for += 1
+            if self.over_for >= MATCH_GAP:
+                self.new_match()
+            self.broadcast(None)  # snapshots for anyone who joined or fell behind
+            return
+        lengths = [len(p.trail) for p in state.players()]
+        step(state)
+        swept = [len(p.trail) - n for p, n in zip(state.players(), lengths)]
+        self.broadcast(encode_delta(state, swept))
+
+    async def run(self, ticks=None):
+        dt = 1.0 / self.tick_rate
+        next_tick = time.perf_counter()
+        count = 0
+        while ticks is None or count < ticks:
+            start = time.perf_counter()
+            self.tick()
+            count += 1
+            next_tick += dt
+            now = time.perf_counter()
+            self.busy = max(self.busy, now - start)
+            self.lateness = max(self.lateness, now - next_tick)
+            await asyncio.sleep(max(0.0, next_tick - now))
+
+# The viewer's side: rebuilds the board from the snapshot and deltas
+class Spectator:
+    def __init__(self):
+        self.tick = None
+        self.cols = self.rows = 0
+        self.owner = bytearray()
+        self.bikes = []  # [name, color, x, y, flags]
+        self.game_over = False
+        self.snapshots = 0
+
+    def apply(self, payload):
+        kind = payload[0]
+        if kind == SNAPSHOT:
+            self.tick, self.cols, self.rows, bikes, self.game_over = struct.unpack_from("<IHHB?", payload, 1)
+            pos = 11
+            self.bikes = []
+            for _ in range(bikes):
+                name = payload[pos + 1:pos + 1 + payload[pos]].decode()
+                pos += 1 + payload[pos]
+                r, g, b, x, y, flags = struct.unpack_from("<BBBhhB", payload, pos)
+                pos += 8
+                self.bikes.append([name, (r, g, b), x, y, flags])
+            self.owner = bytearray(zlib.decompress(payload[pos:]))
+            self.snapshots += 1
+        elif kind == DELTA and self.tick is not None:
+            self.tick, = struct.unpack_from("<I", payload, 1)
+            # Cells are claimed in the order the engine swept them: every
+            # bike's first cell, then every second cell, and so on
+            for sub_step in range(max((flags >> SWEPT_SHIFT for flags in payload[5:]), default=0)):
+                for i, (bike, flags) in enumerate(zip(self.bikes, payload[5:])):
+                    if flags >> SWEPT_SHIFT > sub_step:
+                        dx, dy = DIRECTIONS[flags & HEADING]
+                        bike[2] += dx
+                        bike[3] += dy
+                        x, y = bike[2] // GRID_SIZE, bike[3] // GRID_SIZE
+                        if 0 <= x < self.cols and 0 <= y < self.rows and not self.owner[y * self.cols + x]:
+                            self.owner[y * self.cols + x] = i + 1
+            for bike, flags in zip(self.bikes, payload[5:]):
+                bike[4] = flags
+            self.game_over = any(not flags & ALIVE for flags in payload[5:])
+
+async def watch(host, port, spectator, stop=None, receive_buffer=None):
+    # Follow a broadcast until it ends or stop is set
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    try:
+        while stop is None or not stop.is_set():
+            header = await reader.readexactly(4)
+            spectator.apply(await reader.readexactly(struct.unpack("<I", header)[0]))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def selftest(args):
+    server = BroadcastServer(args.difficulty, args.tick_rate)
+    listener = await server.serve("127.0.0.1", args.port)
+    stop = asyncio.Event()
+    spectators = [Spectator() for _ in range(args.viewers)]
+    # Stalled viewers connect and never read, with a small receive buffer so
+    # their backlog piles up on the server quickly
+    stalled = []
+    for _ in range(args.stalled):
+        sock = socket.create_connection(("127.0.0.1", args.port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+        stalled.append(sock)
+    server.high_water, server.low_water = args.high_water, args.high_water // 8
+    server.send_buffer = 4096
+    early = args.viewers - args.late
+    tasks = [asyncio.ensure_future(watch("127.0.0.1", args.port, s, stop)) for s in spectators[:early]]
+    runner = asyncio.ensure_future(server.run())
+    start = time.perf_counter()
+    await asyncio.sleep(args.seconds / 2)
+    # Late joiners arrive mid-match and start from a snapshot
+    tasks += [asyncio.ensure_future(watch("127.0.0.1", args.port, s, stop)) for s in spectators[early:]]
+    await asyncio.sleep(args.seconds / 2)
+    runner.cancel()
+    elapsed = time.perf_counter() - start
+    # Let everything in flight arrive, then compare every board with the server's
+    await asyncio.sleep(1.0)
+    truth = owner_grid(server.state)
+    fast = [s for s in spectators if s.tick == server.state.tick and s.owner == truth]
+    slow_viewers = [v for v in server.viewers if v.skipped]
+    print(f"{args.viewers} viewers ({args.late} joined late) + {args.stalled} stalled, "
+          f"{server.state.tick} ticks of the current match at {args.tick_rate} ticks/s over {elapsed:.1f}s")
+    print(f"{len(fast)}/{args.viewers} viewers match the server's board at tick {server.state.tick}; "
+          f"{len(slow_viewers)} viewers were held back by backpressure")
+    print(f"worst tick: {server.busy * 1000:.1f} ms to step and broadcast, {server.lateness * 1000:.1f} ms late "
+          f"(the viewers share this process); {server.bytes_queued / 1e6:.1f} MB queued")
+    stop.set()
+    for sock in stalled:
+        sock.close()
+    listener.close()
+    for viewer in server.viewers:
+        viewer.writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.sleep(0.5)
+    return len(fast) == args.viewers
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast bot matches to spectators")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--port", type=int, default=7777)
+    watch_cmd = sub.add_parser("watch")
+    watch_cmd.add_argument("address")
+    test = sub.add_parser("selftest", help="serve and watch on localhost with many viewers")
+    test.add_argument("--port", type=int, default=7777)
+    test.add_argument("--viewers", type=int, default=1000)
+    test.add_argument("--late", type=int, default=100, help="viewers that join halfway through")
+    test.add_argument("--stalled", type=int, default=5, help="viewers that never read")
+    test.add_argument("--high-water", type=int, default=1024, help="backlog limit used for the test")
+    test.add_argument("--seconds", type=float, default=20)
+    test.add_argument("--tick-rate", type=int, default=30)
+    serve.add_argument("--tick-rate", type=int, default=tron_engine.FPS)
+    for cmd in (serve, test):
+        cmd.add_argument("--difficulty", default="hard")
+    args = parser.parse_args()
+
+    if args.command == "selftest":
+        sys.exit(0 if asyncio.run(selftest(args)) else 1)
+    if args.command == "serve":
+        async def run():
+            server = BroadcastServer(args.difficulty, args.tick_rate)
+            await server.serve("0.0.0.0", args.port)
+            print(f"Broadcasting on port {args.port}")
+            await server.run()
+        asyncio.run(run())
+    else:
+        async def run():
+            host, _, port = args.address.rpartition(":")
+            spectator = Spectator()
+            task = asyncio.ensure_future(watch(host or "127.0.0.1", int(port), spectator))
+            while not task.done():
+                await asyncio.sleep(1.0)
+                if spectator.bikes:
+                    heads = ", ".join(f"{name} {'up' if flags & ALIVE else 'down'}"
+                                      for name, _, _, _, flags in spectator.bikes)
+                    print(f"tick {spectator.tick}: {heads}, {sum(1 for c in spectator.owner if c)} cells taken")
+        asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
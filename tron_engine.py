@@ -0,0 +1,510 @@
+import colorsys
+import math
+import random
+import sys
+import time
+from array import array
+from tron_mcts import MonteCarlo
+from tron_search import RootSplit
+from tron_territory import Territory
+from tron_world import snapshot
+
+# Headless game core: players, arena, movement, boost, AI and collision.
+# Nothing here touches pygame, so matches can be simulated on machines
+# without a display; the pygame scripts only read input and draw.
+
+# Constants
+WIDTH, HEIGHT = 800, 600
+GRID_SIZE = 10
+FPS = 10  # default simulation ticks per second
+MAX_TICK_RATE = 1000  # replays and the network keep the tick rate in 16 bits
+MAX_CATCH_UP = 5  # ticks FixedTimestep runs at most per frame after a hitch
+BOOST_SPEED = 2 * GRID_SIZE
+BOOST_DURATION = 1.0  # seconds
+BOOST_COOLDOWN = 3.0  # seconds
+SPAWN_JITTER = 5  # cells a seeded match may shift each spawn by
+TERRITORY_DIFFICULTIES = ("hard", "extreme")
+TERRITORY_WEIGHT = 0.1  # score per cell a move reaches before any opponent
+TRAP_RANGE = 50  # pixels; a head further than this from a move adds nothing to its score
+FFA_BIKES = 8  # bikes in a free-for-all match unless set otherwise
+MAX_BIKES = 64  # a replay records who survived as a 64-bit mask
+MAX_ARENA = 0xFFFF  # cells a side; FreeRuns keeps run lengths in 16 bits
+
+# Tiers that plan with a search object kept on the bike between ticks. They
+# search every joint reply of the other bikes, so in bigger matches those
+# bikes play as extreme instead
+PLANNERS = {"insane": RootSplit, "mcts": MonteCarlo}
+PLANNER_MAX_BIKES = 3
+
+# Colors
+BLUE = (0, 0, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+
+# Headings, in the order ai_move tries them
+RIGHT = (GRID_SIZE, 0)
+LEFT = (-GRID_SIZE, 0)
+UP = (0, -GRID_SIZE)
+DOWN = (0, GRID_SIZE)
+DIRECTIONS = [RIGHT, LEFT, UP, DOWN]
+
+# Player class
+class Player:
+    def __init__(self, x, y, dx, dy, color, name):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.color = color
+        self.name = name
+        self.trail = [(x, y)]
+        self.speed = 1  # cells swept per tick, before boost
+        self.boost_active = False
+        self.boost_timer = 0.0
+        self.boost_cooldown = 0.0
+        self.ai_difficulty = None  # None for bikes steered by a human
+        self.is_ai1 = True
+        self.planner = None  # Search state a bot keeps between ticks
+        self.alive = True
+
+# Game state
+class GameState:
+    def __init__(self, width=WIDTH, height=HEIGHT, seed=None):
+        self.width = width
+        self.height = height
+        self.cols = width // GRID_SIZE
+        self.rows = height // GRID_SIZE
+        # Every bike in the match; player1, player2 and player3 name the first three
+        self.bikes = [Player(100, 300, GRID_SIZE, 0, BLUE, "Player 1"),
+                      Player(700, 300, -GRID_SIZE, 0, RED, "Player 2")]
+        self.bike_count = FFA_BIKES  # bikes in a free-for-all match
+        self.world = None  # tron_world.Snapshot of the current tick, built when a bot first asks
+        self.grid = bytearray(self.cols * self.rows)  # 1 where a trail cell (not a head) sits
+        self.runs = FreeRuns(self.cols, self.rows)  # kept in step with grid by occupy()
+        self.territory = None  # Built the first time a hard/extreme bot looks ahead
+        self.use_territory = True
+        self.game_over = False
+        self.winners = []
+        self.game_mode = None  # "two_player", "ai", "dual_ai", "ffa"
+        self.ai_difficulty = None  # "easy", "medium", "hard", "extreme", "insane", "mcts"
+        self.god_mode = False
+        self.ai_target_player = True
+        self.tick = 0
+        self.tick_rate = FPS  # simulation ticks per second, sets the boost timers' dt
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    def players(self):
+        return list(self.bikes)
+
+    @property
+    def player1(self):
+        return self.bikes[0]
+
+    @player1.setter
+    def player1(self, player):
+        self.bikes[0] = player
+
+    @property
+    def player2(self):
+        return self.bikes[1]
+
+    @player2.setter
+    def player2(self, player):
+        self.bikes[1] = player
+
+    @property
+    def player3(self):
+        # AI 2 in Dual AI Mode, None when there are only two bikes
+        return self.bikes[2] if len(self.bikes) > 2 else None
+
+    @player3.setter
+    def player3(self, player):
+        del self.bikes[2:]
+        if player:
+            self.bikes.append(player)
+
+def spawn_points(seed=None, width=WIDTH, height=HEIGHT):
+    # Classic spawns, at the same spots relative to the arena as (100, 300),
+    # (700, 300) and (400, 100) on 800x600; a seeded match nudges each one so
+    # bot games differ
+    def snap(v):
+        return v // GRID_SIZE * GRID_SIZE
+    spawns = [(snap(width // 8), snap(height // 2)), (snap(width * 7 // 8), snap(height // 2)),
+              (snap(width // 2), snap(height // 6))]
+    if seed is None:
+        return spawns
+    rng = random.Random(seed)
+    return [(x + rng.randint(-SPAWN_JITTER, SPAWN_JITTER) * GRID_SIZE,
+             y + rng.randint(-SPAWN_JITTER, SPAWN_JITTER) * GRID_SIZE) for x, y in spawns]
+
+def ffa_spawns(count, width=WIDTH, height=HEIGHT, seed=None):
+    # Free-for-all spawns, (x, y, dx, dy) each: an even lattice over the
+    # arena, alternate rows heading opposite ways so no two bikes start nose
+    # to nose. A seeded match shuffles which bike gets which spot
+    across = max(1, math.ceil(math.sqrt(count * width / height)))
+    down = math.ceil(count / across)
+    spawns = []
+    for i in range(count):
+        row, col = divmod(i, across)
+        x = (2 * col + 1) * width // (2 * across) // GRID_SIZE * GRID_SIZE
+        y = (2 * row + 1) * height // (2 * down) // GRID_SIZE * GRID_SIZE
+        spawns.append((x, y) + (RIGHT if row % 2 == 0 else LEFT))
+    if seed is not None:
+        random.Random(seed).shuffle(spawns)
+    return spawns
+
+def bike_color(index, count):
+    # The classic blue, red and green, then hues spread around the wheel
+    if index < 3:
+        return (BLUE, RED, GREEN)[index]
+    r, g, b = colorsys.hsv_to_rgb((index - 3) / max(1, count - 3), 0.7, 1.0)
+    return (round(r * 255), round(g * 255), round(b * 255))
+
+def reset(state, player1_name="Player 1", player2_name="Player 2", seed=None):
+    if state.game_mode == "ffa":
+        # Player 1 against bike_count - 1 bots
+        state.bikes = []
+        for i, (x, y, dx, dy) in enumerate(ffa_spawns(state.bike_count, state.width, state.height, seed)):
+            player = Player(x, y, dx, dy, bike_color(i, state.bike_count), f"AI {i}" if i else player1_name)
+            if i:
+                player.ai_difficulty = state.ai_difficulty
+                player.is_ai1 = i % 2 == 1
+            state.bikes.append(player)
+    else:
+        (x1, y1), (x2, y2), (x3, y3) = spawn_points(seed, state.width, state.height)
+        state.bikes = [Player(x1, y1, GRID_SIZE, 0, BLUE, player1_name),
+                       Player(x2, y2, -GRID_SIZE, 0, RED, player2_name if state.game_mode == "two_player" else "AI 1")]
+        if state.game_mode == "dual_ai":
+            state.player3 = Player(x3, y3, 0, GRID_SIZE, GREEN, "AI 2")
+            state.player3.is_ai1 = False
+        if state.game_mode in ["ai", "dual_ai"]:
+            state.player2.ai_difficulty = state.ai_difficulty
+            if state.player3:
+                state.player3.ai_difficulty = state.ai_difficulty
+    state.world = None
+    state.grid = bytearray(state.cols * state.rows)
+    state.runs = FreeRuns(state.cols, state.rows)
+    state.territory = None
+    state.game_over = False
+    state.winners = []
+    state.god_mode = False
+    state.ai_target_player = True
+    state.tick = 0
+    state.seed = seed
+    state.rng = random.Random(seed)
+    return state
+
+def set_arena(state, width, height):
+    # Arena size in pixels; takes effect at the next reset
+    state.width, state.height = width, height
+    state.cols, state.rows = width // GRID_SIZE, height // GRID_SIZE
+
+# Free runs: for every cell and each of DIRECTIONS, how many free cells a
+# ray from it crosses (the cell itself included) before a trail or the
+# arena's edge. Occupying a cell only shortens the runs of the free cells
+# lined up with it in its row and column, which are rewritten with one
+# slice each, so a bot's look along a heading is a single lookup.
+class FreeRuns:
+    def __init__(self, cols, rows):
+        self.cols = cols
+        limit = max(cols, rows)
+        self.ascending = array("H", range(1, limit + 1))
+        self.descending = array("H", range(limit, 0, -1))
+        self.right = self.descending[limit - cols:] * rows
+        self.left = self.ascending[:cols] * rows
+        self.up = array("H")
+        self.down = array("H")
+        for row in range(rows):
+            self.up += array("H", [row + 1]) * cols
+            self.down += array("H", [rows - row]) * cols
+        self.fields = [self.right, self.left, self.up, self.down]  # in DIRECTIONS order
+
+    def occupy(self, cell):
+        cols, limit = self.cols, len(self.ascending)
+        right, left, up, down = self.fields
+        run = left[cell]
+        right[cell - run + 1:cell] = self.descending[limit - run + 1:]
+        run = right[cell]
+        left[cell + 1:cell + run] = self.ascending[:run - 1]
+        run = up[cell]
+        down[cell - (run - 1) * cols:cell:cols] = self.descending[limit - run + 1:]
+        run = down[cell]
+        up[cell + cols:cell + run * cols:cols] = self.ascending[:run - 1]
+        right[cell] = left[cell] = up[cell] = down[cell] = 0
+
+# Occupancy grid: every trail cell except the current heads, one byte per cell
+def occupy(state, x, y):
+    if 0 <= x < state.width and 0 <= y < state.height:
+        cell = y // GRID_SIZE * state.cols + x // GRID_SIZE
+        if not state.grid[cell]:
+            state.grid[cell] = 1
+            state.runs.occupy(cell)
+
+def is_occupied(state, x, y):
+    return state.grid[y // GRID_SIZE * state.cols + x // GRID_SIZE] != 0
+
+def extend_trail(state, player):
+    # The old head becomes a solid trail cell once the bike moves on
+    occupy(state, *player.trail[-1])
+    player.trail.append((player.x, player.y))
+
+def nearby_heads(state, player):
+    # Heads of the other live bikes that can be within TRAP_RANGE of any move
+    # this bike makes. The heads are bucketed once per tick, so with dozens of
+    # bikes each lookup still only looks at the few close by
+    reach = TRAP_RANGE + GRID_SIZE
+    buckets = snapshot(state).bucketed(reach)
+    bx, by = player.x // reach, player.y // reach
+    return [other for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            for other in buckets.get((bx + dx, by + dy), ()) if other is not player]
+
+def check_collision(state, player):
+    if player == state.player1 and state.god_mode:
+        return False
+    if player.x < 0 or player.x >= state.width or player.y < 0 or player.y >= state.height:
+        return True
+    return is_occupied(state, player.x, player.y)
+
+def apply_command(player, command):
+    # Same rules as the keyboard: no reversing, boost only once cooled down
+    if command == "up" and player.dy != GRID_SIZE:
+        player.dx, player.dy = UP
+    elif command == "down" and player.dy != -GRID_SIZE:
+        player.dx, player.dy = DOWN
+    elif command == "left" and player.dx != GRID_SIZE:
+        player.dx, player.dy = LEFT
+    elif command == "right" and player.dx != -GRID_SIZE:
+        player.dx, player.dy = RIGHT
+    elif command == "boost" and not player.boost_active and player.boost_cooldown <= 0:
+        player.boost_active = True
+        player.boost_timer = BOOST_DURATION
+
+def cells_per_tick(player):
+    return player.speed * BOOST_SPEED // GRID_SIZE if player.boost_active else player.speed
+
+def update_boost(player, dt=1.0 / FPS):
+    if player.boost_active:
+        player.boost_timer -= dt
+        if player.boost_timer <= 0:
+            player.boost_active = False
+            player.boost_cooldown = BOOST_COOLDOWN
+    if player.boost_cooldown > 0:
+        player.boost_cooldown -= dt
+
+def ai_move(state, player, rays_only=False):
+    heading = ai_heading(state, player, rays_only)
+    if heading:
+        player.dx, player.dy = heading
+
+def ai_heading(state, player, rays_only=False, search_time=None):
+    # The heading the bot picks for the next tick, or None to keep its own.
+    # rays_only leaves out the planners and the territory count: the cheap
+    # look used when a decision has to be made on the spot. search_time caps
+    # a planner's think in seconds; it answers with the best move found by then
+    difficulty = player.ai_difficulty
+    if difficulty in PLANNERS:
+        if len(state.bikes) > PLANNER_MAX_BIKES or rays_only:
+            difficulty = "extreme"
+        else:
+            if player.planner is None:
+                player.planner = PLANNERS[difficulty](state)
+            if search_time is not None:
+                player.planner.search_time = search_time
+            move = player.planner.choose(state, player)
+            return DIRECTIONS[move] if move is not None else None
+
+    directions = [d for d in DIRECTIONS if d != (-player.dx, -player.dy)]
+    is_ai1 = player.is_ai1
+
+    if difficulty == "easy":
+        max_steps = 20 if is_ai1 else 10
+        trap_player = state.ai_target_player and not is_ai1
+    elif difficulty == "medium":
+        max_steps = 30 if is_ai1 else 15
+        trap_player = state.ai_target_player and not is_ai1
+    elif difficulty == "hard":
+        max_steps = 40 if is_ai1 else 20
+        trap_player = state.ai_target_player
+    else:  # extreme
+        max_steps = 60 if is_ai1 else 30
+        trap_player = state.ai_target_player
+
+    safe_directions = []
+    scores = []
+    width, height, cols = state.width, state.height, state.cols
+    fields = state.runs.fields
+    # Every other bike is a target, which is what the old player1/player2/player3
+    # special-casing worked out to; only the ones in range can change a score
+    targets = nearby_heads(state, player) if trap_player else []
+
+    for dx, dy in directions:
+        new_x, new_y = player.x + dx, player.y + dy
+        if not (new_x < 0 or new_x >= width or new_y < 0 or new_y >= height):
+            # Free cells straight ahead, this one first; 0 when it is taken
+            run = fields[DIRECTIONS.index((dx, dy))][new_y // GRID_SIZE * cols + new_x // GRID_SIZE]
+            if run:
+                safe_directions.append((dx, dy))
+                score = min(run, max_steps)
+                if trap_player:
+                    min_dist = float('inf')
+                    for target in targets:
+                        dist = math.hypot(target.x - new_x, target.y - new_y)
+                        min_dist = min(min_dist, dist)
+                    score += max(0, TRAP_RANGE - min_dist) * (0.1 if is_ai1 else 0.3)
+                scores.append(score)
+
+    if safe_directions and state.use_territory and difficulty in TERRITORY_DIFFICULTIES and not rays_only:
+        # Rays cannot see dead-end pockets; weigh each move by the cells it
+        # claims before the opponents do
+        if state.territory is None:
+            state.territory = Territory(state)
+        moves = [(player.x + dx, player.y + dy) for dx, dy in safe_directions]
+        owned = state.territory.reach_first(state, player, moves)
+        scores = [score + TERRITORY_WEIGHT * count for score, count in zip(scores, owned)]
+
+    if safe_directions:
+        if scores:
+            return safe_directions[scores.index(max(scores))]
+        return state.rng.choice(safe_directions)
+    return None
+
+def step(state, actions=None, timer=None, decisions=None):
+    # Advance the match by one tick. actions maps a player index (position in
+    # state.players()) to the commands issued during that tick, in order, e.g.
+    # {0: ["up", "boost"]}. decisions maps a bot's index to a heading already
+    # worked out for this tick (None to keep its own, see tron_worker); the
+    # other bots think here. The state is updated in place and returned
+    # together with the events the tick produced. A tron_timing.PhaseTimer
+    # passed as timer gets a mark after each phase.
+    events = []
+    players = state.players()
+    if actions:
+        for i, commands in actions.items():
+            for command in commands:
+                apply_command(players[i], command)
+    for player in players:
+        update_boost(player, 1.0 / state.tick_rate)
+    if timer:
+        timer.mark("boost")
+    if state.game_over:
+        return state, events
+
+    # Bikes that went down earlier in a free-for-all stay where they are
+    moving = [p for p in players if p.alive]
+    for index, player in enumerate(players):
+        if not (player.alive and player.ai_difficulty):
+            continue
+        if decisions is not None and index in decisions:
+            if decisions[index]:
+                player.dx, player.dy = decisions[index]
+        else:
+            ai_move(state, player)
+            if timer:
+                timer.mark("ai_move " + player.name)
+    # Bikes move one cell at a time, every bike's first cell before anyone's
+    # second, so a fast or boosting bike marks and tests each cell it passes
+    # over instead of jumping it. Within a sub-step everyone has moved before
+    # anything is decided, so the order of the bikes never matters: a bike is
+    # out if it left the arena, hit a trail (every old head is trail by now)
+    # or landed on the same cell as another, and it stops where it crashed.
+    # A bike that has already swept all its cells sits on its head for the
+    # rest of the tick, and running into it is a crash too
+    sweeps = [(player, cells_per_tick(player)) for player in moving]
+    crashed = []
+    collision_time = 0.0  # of the sweep, for the timer
+    for sub_step in range(max((cells for _, cells in sweeps), default=0)):
+        movers = [p for p, cells in sweeps if cells > sub_step and p.alive]
+        landed = {(p.x, p.y): 1 for p, cells in sweeps if cells <= sub_step and p.alive}
+        for player in movers:
+            player.x += player.dx
+            player.y += player.dy
+            extend_trail(state, player)
+            if state.territory:
+                state.territory.block_head(player)
+            landed[player.x, player.y] = landed.get((player.x, player.y), 0) + 1
+        if timer:
+            collisions_from = time.perf_counter()
+        for player in movers:
+            if check_collision(state, player) or (landed[player.x, player.y] > 1
+                                                  and not (player is state.player1 and state.god_mode)):
+                player.alive = False
+                crashed.append(player)
+        for player in movers:
+            if not player.alive:
+                occupy(state, player.x, player.y)  # the wreck is a wall from now on
+        if timer:
+            collision_time += time.perf_counter() - collisions_from
+    state.tick += 1
+    if timer:
+        timer.mark("move", collision_time)
+        timer.record("collision", collision_time)
+
+    if crashed:
+        for player in crashed:
+            events.append(("crash", player.name))
+        alive = [p for p in players if p.alive]
+        # Classic modes end at the first crash, a free-for-all with the last bike
+        if state.game_mode != "ffa" or len(alive) <= 1:
+            state.game_over = True
+            state.winners = [p.name for p in alive]
+            events.append(("game_over", state.winners))
+    return state, events
+
+# Fixed-timestep scheduler for the front-ends: wall-clock time goes into an
+# accumulator and comes out as whole ticks of 1 / tick_rate seconds, so the
+# match runs at the same speed and through the same ticks whatever the frame
+# rate is. alpha() is how far the clock is into the next tick, for drawing
+# bikes between cells.
+class FixedTimestep:
+    def __init__(self, tick_rate=FPS, max_ticks=MAX_CATCH_UP):
+        self.dt = 1.0 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.last = None
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.last = None
+
+    def advance(self, tick_rate=None):
+        # Number of ticks due since the last call
+        if tick_rate:
+            self.dt = 1.0 / tick_rate
+        now = time.perf_counter()
+        if self.last is not None:
+            self.accumulator += now - self.last
+        self.last = now
+        ticks = min(int(self.accumulator / self.dt), self.max_ticks)
+        # After a long hitch the backlog beyond max_ticks is dropped: the
+        # match slows down for a moment instead of jumping ahead
+        self.accumulator -= ticks * self.dt
+        if self.accumulator >= self.dt:
+            self.accumulator %= self.dt
+        return ticks
+
+    def alpha(self):
+        return min(self.accumulator / self.dt, 1.0)
+
+def play_match(state, max_ticks=10000):
+    while not state.game_over and state.tick < max_ticks:
+        step(state)
+    return state
+
+if __name__ == "__main__":
+    # Headless throughput check: bots on every bike, no window
+    difficulty = sys.argv[1] if len(sys.argv) > 1 else "hard"
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    start = time.perf_counter()
+    ticks = 0
+    for seed in range(matches):
+        state = GameState(seed=seed)
+        state.game_mode = "dual_ai"
+        state.ai_difficulty = difficulty
+        reset(state, seed=seed)
+        state.player1.ai_difficulty = difficulty
+        play_match(state)
+        ticks += state.tick
+    elapsed = time.perf_counter() - start
+    print(f"{matches} {difficulty} matches, {ticks} ticks in {elapsed:.2f}s "
+          f"({matches / elapsed:.0f} matches/s, {ticks / elapsed:.0f} ticks/s)")
@@ -0,0 +1,216 @@
+import math
+import random
+import sys
+import time
+from tron_world import snapshot
+
+# Monte Carlo tree search for the "mcts" difficulty.
+#
+# The tree only branches on this bot's own moves; opponents are part of the
+# environment and their replies are sampled by the rollout policy, with each
+# reply seen so far kept as its own subtree. Playouts run on a padded
+# bytearray copy of the arena rather than on Player.trail lists, and the
+# tree survives between ticks: once the real moves are known, the subtree
+# for them becomes the new root.
+
+MCTS_TIME = 0.03  # seconds per decision
+ROLLOUT_DEPTH = 40  # ticks a playout runs before it is scored as a draw
+EXPLORATION = 1.4
+STRAIGHT_BIAS = 0.7  # chance a rollout bike keeps its heading when it can
+
+class Node:
+    def __init__(self):
+        self.visits = 0
+        self.edges = {}  # my move -> Edge
+
+class Edge:
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+        self.replies = {}  # opponents' joint move -> Node
+
+class MonteCarlo:
+    def __init__(self, state, search_time=MCTS_TIME, seed=None):
+        self.cols = state.cols
+        self.rows = state.rows
+        self.stride = self.cols + 2
+        self.size = self.stride * (self.rows + 2)
+        # Headings in tron_engine.DIRECTIONS order: right, left, up, down
+        self.steps = (1, -1, -self.stride, self.stride)
+        self.search_time = search_time
+        self.rng = random.Random(state.seed if seed is None else seed)
+        self.root = Node()
+        self.last_move = None
+        self.last_heads = None
+        self.playouts = 0
+        self.reused = 0
+        self.time = 0.0
+
+    def load(self, state):
+        # Playouts make and undo moves on occ, so they get their own copy
+        world = snapshot(state)
+        return bytearray(world.occupancy()), list(world.heads)
+
+    def reroot(self, me, heads):
+        # Follow the edge for the move this bot made and the subtree for what
+        # the opponents actually did; anything else starts a fresh tree
+        edge = self.root.edges.get(self.last_move) if self.last_heads else None
+        if edge is None or len(heads) != len(self.last_heads):
+            return Node()
+        moved = []
+        for bike, (old, new) in enumerate(zip(self.last_heads, heads)):
+            if old is None or new is None:
+                move = None
+            elif new - old in self.steps:
+                move = self.steps.index(new - old)
+            else:
+                return Node()  # boosted or teleported, the tree no longer fits
+            if bike == me:
+                if move != self.last_move:
+                    return Node()
+            else:
+                moved.append(move)
+        node = edge.replies.get(tuple(moved))
+        if node is None:
+            return Node()
+        self.reused += node.visits
+        return node
+
+    def free_moves(self, occ, head):
+        return [d for d, step in enumerate(self.steps) if not occ[head + step]]
+
+    def rollout_move(self, occ, head, last):
+        moves = self.free_moves(occ, head)
+        if not moves:
+            return None
+        if last in moves and self.rng.random() < STRAIGHT_BIAS:
+            return last
+        return self.rng.choice(moves)
+
+    def advance(self, occ, heads, moves):
+        # Apply one simultaneous tick; returns which bikes went down
+        targets = []
+        for head, move in zip(heads, moves):
+            if head is None or move is None:
+                targets.append(None)
+                continue
+            target = head + self.steps[move]
+            targets.append(None if occ[target] else target)
+        for i, target in enumerate(targets):
+            if target is not None and targets.count(target) > 1:
+                targets[i] = None  # head-on
+        for i, target in enumerate(targets):
+            heads[i] = target
+            if target is not None:
+                occ[target] = 1
+
+    def score(self, me, heads):
+        # 1 for a win, 0 for a loss, 0.5 otherwise, or None while undecided
+        mine = heads[me] is not None
+        others = any(h is not None for i, h in enumerate(heads) if i != me)
+        if mine and others:
+            return None
+        if mine:
+            return 1.0
+        return 0.0 if others else 0.5
+
+    def playout(self, me, occ, root_heads):
+        # Plays on the root board itself and clears the cells it took
+        # afterwards, so a playout costs the same on any size of arena
+        heads = list(root_heads)
+        taken = []
+        last = [None] * len(heads)
+        node = self.root
+        path = []
+        # Selection and expansion: UCB over this bot's moves, sampled replies
+        while True:
+            moves = self.free_moves(occ, heads[me])
+            if not moves:
+                break
+            untried = [m for m in moves if m not in node.edges]
+            if untried:
+                move = self.rng.choice(untried)
+                node.edges[move] = Edge()
+            else:
+                log_visits = math.log(node.visits + 1)
+                move = max(moves, key=lambda m: node.edges[m].value / (node.edges[m].visits or 1)
+                           + EXPLORATION * math.sqrt(log_visits / (node.edges[m].visits or 1)))
+            edge = node.edges[move]
+            joint = [None] * len(heads)
+            joint[me] = move
+            for i, head in enumerate(heads):
+                if i != me and head is not None:
+                    joint[i] = self.rollout_move(occ, head, last[i])
+            self.advance(occ, heads, joint)
+            taken += [h for h in heads if h is not None]
+            last = joint
+            path.append((node, edge))
+            reply = tuple(m for i, m in enumerate(joint) if i != me)
+            child = edge.replies.get(reply)
+            if child is None or self.score(me, heads) is not None:
+                if child is None:
+                    edge.replies[reply] = Node()
+                break
+            node = child
+
+        # Rollout from the new leaf
+        result = self.score(me, heads)
+        depth = 0
+        while result is None and depth < ROLLOUT_DEPTH:
+            joint = [self.rollout_move(occ, h, last[i]) if h is not None else None for i, h in enumerate(heads)]
+            self.advance(occ, heads, joint)
+            taken += [h for h in heads if h is not None]
+            last = joint
+            result = self.score(me, heads)
+            depth += 1
+        for c in taken:
+            occ[c] = 0
+        if result is None:
+            result = 0.5
+        for node, edge in path:
+            node.visits += 1
+            edge.visits += 1
+            edge.value += result
+        self.playouts += 1
+
+    def choose(self, state, player):
+        start = time.perf_counter()
+        players = state.players()
+        me = players.index(player)
+        occ, heads = self.load(state)
+        if heads[me] is None or not self.free_moves(occ, heads[me]):
+            return None
+        self.root = self.reroot(me, heads)
+        deadline = start + self.search_time
+        while time.perf_counter() < deadline:
+            self.playout(me, occ, heads)
+        edges = self.root.edges
+        move = max(edges, key=lambda m: edges[m].visits) if edges else self.free_moves(occ, heads[me])[0]
+        self.last_move = move
+        self.last_heads = heads
+        self.time += time.perf_counter() - start
+        return move
+
+    def report(self):
+        rate = self.playouts / self.time if self.time else 0
+        return f"{self.playouts} playouts, {rate:.0f} playouts/s, {self.reused} visits carried over by re-rooting"
+
+if __name__ == "__main__":
+    # python tron_mcts.py <ms per decision> <matches>: mcts against extreme
+    import tron_engine
+    search_time = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else MCTS_TIME
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    wins = losses = 0
+    for seed in range(matches):
+        state = tron_engine.GameState(seed=seed)
+        state.game_mode = "ai"
+        tron_engine.reset(state, seed=seed)
+        bot, rival = (state.player1, state.player2) if seed % 2 == 0 else (state.player2, state.player1)
+        bot.ai_difficulty = "mcts"
+        rival.ai_difficulty = "extreme"
+        bot.planner = MonteCarlo(state, search_time)
+        tron_engine.play_match(state, 3000)
+        wins += bot.alive and not rival.alive
+        losses += rival.alive and not bot.alive
+        print(f"match {seed}: {state.tick} ticks, winners {state.winners}; {bot.planner.report()}")
+    print(f"mcts vs extreme: {wins} wins, {losses} losses, {matches - wins - losses} draws")
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import math
+import random
+import struct
+import sys
+import time
+import zlib
+import tron_engine
+from tron_engine import DIRECTIONS, FixedTimestep, ai_move, reset, step
+
+# Lockstep network play over UDP.
+#
+# Both machines run the whole match. The only thing sent is each player's
+# input for each tick, as one byte, and it is scheduled INPUT_DELAY ticks
+# ahead: a key pressed during frame f is applied at f + INPUT_DELAY on both
+# sides. A frame is only stepped once both players' inputs for it are in,
+# so the two simulations cannot drift apart; if the other side's input is
+# late the game waits for it. Every packet carries all inputs the other side
+# has not acknowledged yet, so a lost or reordered datagram is covered by
+# the next one, and every CHECK_EVERY frames a checksum of the state goes
+# along so a desync is caught rather than played through. A session is one
+# match; after game over the peers keep exchanging (empty) frames until
+# someone leaves.
+#
+#   python tron_net.py host 5555                  wait for a player to join
+#   python tron_net.py join 127.0.0.1:5555        join (bots play both bikes)
+#   python tron_net.py selftest --latency 60 --jitter 20 --loss 0.1
+#
+# The pygame front-ends take the same --host PORT / --join HOST:PORT options.
+
+INPUT_DELAY = 3  # frames between a key press and the frame that applies it
+CHECK_EVERY = 10  # frames between state checksums
+RESEND_INTERVAL = 0.05  # seconds between resends while waiting on the other side
+LINGER = 1.0  # seconds a side that has finished keeps answering the other
+HELLO, START, INPUT, INPUT_CHECK = 1, 2, 3, 4
+COMMANDS = [None, "up", "down", "left", "right"]
+BOOST = 8
+
+def encode_commands(commands):
+    # The last turn of the frame plus a boost bit: one byte per player per frame
+    code = 0
+    for command in commands:
+        if command == "boost":
+            code |= BOOST
+        elif command in COMMANDS:
+            code = code & BOOST | COMMANDS.index(command)
+    return code
+
+def decode_commands(code):
+    commands = [COMMANDS[code & 7]] if code & 7 else []
+    if code & BOOST:
+        commands.append("boost")
+    return commands
+
+def checksum(state):
+    data = struct.pack("<I", state.tick) + b"".join(
+        struct.pack("<hh?", p.x, p.y, p.alive) for p in state.players())
+    return zlib.crc32(data, zlib.crc32(state.grid))
+
+def unwrap(value, near):
+    # Frames go on the wire as 16 bits; recover the full number closest to near
+    return near + (value - near + 0x8000) % 0x10000 - 0x8000
+
+def pack_str(text):
+    data = text.encode()[:255]
+    return bytes([len(data)]) + data
+
+def unpack_str(data, pos):
+    return data[pos + 1:pos + 1 + data[pos]].decode(), pos + 1 + data[pos]
+
+# Test shim between a peer and its socket: each datagram is dropped with
+# probability loss, otherwise delivered after latency +- jitter seconds
+# (so datagrams also arrive out of order)
+class LossyTransport:
+    def __init__(self, transport, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.transport = transport
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+
+    def sendto(self, data, addr=None):
+        if self.rng.random() < self.loss:
+            return
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        asyncio.get_running_loop().call_later(delay, self.transport.sendto, data, addr)
+
+    def close(self):
+        self.transport.close()
+
+class LockstepPeer(asyncio.DatagramProtocol):
+    def __init__(self, index, name, delay=INPUT_DELAY, shim=None):
+        self.index = index  # this side's bike; the host is 0, the joiner 1
+        self.name = name
+        self.delay = delay
+        self.shim = shim  # (latency, jitter, loss) for a LossyTransport
+        self.transport = None
+        self.addr = None
+        self.other_name = None
+        self.seed = None
+        self.tick_rate = tron_engine.FPS
+        self.started = None
+        self.local = {}  # inputs by frame
+        self.remote = {}
+        self.remote_next = 0  # every remote input below this frame is in
+        self.acked = 0  # the other side has every local input below this frame
+        self.frame = 0
+        self.begin(delay)
+        self.checksums = {}
+        self.check_due = None  # frame whose checksum goes out with the next packet
+        self.other_check = None
+        self.desync = None
+        self.last_send = 0.0
+        self.bytes_sent = self.packets_sent = 0
+
+    def begin(self, delay):
+        # The first `delay` frames have no input on either side
+        self.delay = delay
+        self.local = dict.fromkeys(range(delay), 0)
+        self.remote = dict.fromkeys(range(delay), 0)
+        self.remote_next = delay
+
+    def connection_made(self, transport):
+        self.transport = LossyTransport(transport, *self.shim) if self.shim else transport
+        self.started = asyncio.get_running_loop().create_future()
+
+    def send(self, data):
+        self.transport.sendto(data, self.addr)
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        self.last_send = time.perf_counter()
+
+    def datagram_received(self, data, addr):
+        kind = data[0]
+        if kind == HELLO and self.index == 0 and self.addr in (None, addr):
+            # The joiner, or the joiner again if its START got lost: (re)send
+            # the match setup. Anyone else knocking once the match is on is ignored
+            self.addr = addr
+            self.other_name, _ = unpack_str(data, 1)
+            self.send(struct.pack("<BqHB", START, self.seed, self.tick_rate, self.delay) + pack_str(self.name))
+            if not self.started.done():
+                self.started.set_result(True)
+        elif kind == START and self.index == 1 and not self.started.done():
+            self.seed, self.tick_rate, delay = struct.unpack_from("<qHB", data, 1)
+            self.other_name, _ = unpack_str(data, 12)
+            self.begin(delay)
+            self.started.set_result(True)
+        elif kind in (INPUT, INPUT_CHECK) and addr == self.addr:
+            ack, first, count = struct.unpack_from("<HHB", data, 1)
+            self.acked = max(self.acked, unwrap(ack, self.acked))
+            first = unwrap(first, self.remote_next)
+            for i in range(count):
+                self.remote.setdefault(first + i, data[6 + i])
+            while self.remote_next in self.remote:
+                self.remote_next += 1
+            if kind == INPUT_CHECK:
+                frame, value = struct.unpack_from("<HI", data, 6 + count)
+                self.other_check = (unwrap(frame, self.frame), value)
+                self.compare(self.other_check[0])
+
+    def compare(self, frame):
+        if self.other_check and self.other_check[0] == frame and frame in self.checksums:
+            if self.checksums[frame] != self.other_check[1]:
+                self.desync = frame
+
+    def flush(self):
+        # Send every input the other side has not confirmed yet (at most 255)
+        first = max(self.acked, min(self.local))
+        inputs = bytes(self.local[f] for f in range(first, first + 255) if f in self.local)
+        header = (self.remote_next & 0xFFFF, first & 0xFFFF, len(inputs))
+        if self.check_due is None:
+            self.send(struct.pack("<BHHB", INPUT, *header) + inputs)
+        else:
+            frame = self.check_due
+            self.send(struct.pack("<BHHB", INPUT_CHECK, *header) + inputs
+                      + struct.pack("<HI", frame & 0xFFFF, self.checksums[frame]))
+            self.check_due = None
+
+    def exchange(self, commands):
+        # Hand in this frame's local commands (they apply `delay` frames from
+        # now) and get the actions for the current frame, or None while the
+        # other side's input for it has not arrived
+        if self.frame + self.delay not in self.local:
+            self.local[self.frame + self.delay] = encode_commands(commands)
+            commands.clear()
+            self.flush()
+        if self.frame not in self.remote:
+            if time.perf_counter() - self.last_send > RESEND_INTERVAL:
+                self.flush()
+            return None
+        actions = {self.index: decode_commands(self.local[self.frame]),
+                   1 - self.index: decode_commands(self.remote[self.frame])}
+        # Inputs both sides have used can go
+        self.local.pop(self.frame - 64, None)
+        self.remote.pop(self.frame - 64, None)
+        self.frame += 1
+        return actions
+
+    def confirm(self, state):
+        # Call after stepping the frame exchange() returned actions for
+        if self.frame % CHECK_EVERY == 0:
+            self.checksums[self.frame] = checksum(state)
+            self.check_due = self.frame
+            self.checksums.pop(self.frame - 64 * CHECK_EVERY, None)
+            self.compare(self.frame)
+
+    def finished(self, frames):
+        # Both sides' inputs up to frames are in on both sides, as far as
+        # this side can tell; the other side may still be waiting on an ack
+        return (self.frame >= frames and self.acked >= frames + self.delay
+                and self.remote_next >= frames + self.delay)
+
+    def idle(self):
+        # Keep the other side supplied while this side has nothing to do
+        if time.perf_counter() - self.last_send > RESEND_INTERVAL:
+            self.flush()
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+async def host(port, name="Player 1", seed=None, tick_rate=tron_engine.FPS, delay=INPUT_DELAY, shim=None):
+    loop = asyncio.get_running_loop()
+    peer = LockstepPeer(0, name, delay, shim)
+    peer.seed = random.randrange(1 << 31) if seed is None else seed
+    peer.tick_rate = tick_rate
+    await loop.create_datagram_endpoint(lambda: peer, local_addr=("0.0.0.0", port))
+    await peer.started
+    return peer
+
+async def join(address, name="Player 2", shim=None):
+    loop = asyncio.get_running_loop()
+    host_name, _, port = address.rpartition(":")
+    peer = LockstepPeer(1, name, shim=shim)
+    peer.addr = (host_name or "127.0.0.1", int(port))
+    await loop.create_datagram_endpoint(lambda: peer, remote_addr=peer.addr)
+    while not peer.started.done():
+        peer.send(bytes([HELLO]) + pack_str(name))
+        await asyncio.wait([peer.started], timeout=0.25)
+    return peer
+
+async def from_args(argv, host_name="Player 1", join_name="Player 2"):
+    # --host PORT or --join HOST:PORT from a front-end's command line; None
+    # to play locally
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=int)
+    parser.add_argument("--join")
+    args, _ = parser.parse_known_args(argv)
+    if args.host:
+        print(f"Waiting for a player on port {args.host}...")
+        return await host(args.host, host_name)
+    if args.join:
+        return await join(args.join, join_name)
+    return None
+
+def new_match(seed):
+    state = tron_engine.GameState(seed=seed)
+    state.game_mode = "two_player"
+    reset(state, seed=seed)
+    return state
+
+def bot_commands(state, index):
+    # What the hard bot would do with this bike, as a key press
+    player = state.players()[index]
+    heading = player.dx, player.dy
+    difficulty, player.ai_difficulty = player.ai_difficulty, "hard"
+    ai_move(state, player)
+    turn = DIRECTIONS.index((player.dx, player.dy))
+    player.dx, player.dy = heading
+    player.ai_difficulty = difficulty
+    return [["right", "left", "up", "down"][turn]]
+
+async def play_bot(peer, frames):
+    # Headless lockstep loop with the hard bot choosing this side's inputs
+    timestep = FixedTimestep(peer.tick_rate)
+    state = new_match(peer.seed)
+    while not peer.finished(frames):
+        for _ in range(timestep.advance()):
+            if peer.frame >= frames:
+                break
+            actions = peer.exchange([] if state.game_over else bot_commands(state, peer.index))
+            if actions is None:
+                break
+            step(state, actions)
+            peer.confirm(state)
+        peer.idle()
+        if peer.desync is not None:
+            break
+        await asyncio.sleep(timestep.dt / 4)
+    # The other side may not have seen the last ack yet: keep resending it
+    end = time.perf_counter() + LINGER
+    while peer.desync is None and time.perf_counter() < end:
+        peer.idle()
+        await asyncio.sleep(RESEND_INTERVAL)
+    return state
+
+async def selftest(args):
+    shim = (args.latency / 1000, args.jitter / 1000, args.loss)
+    host_task = asyncio.ensure_future(host(args.port, seed=args.seed, tick_rate=args.tick_rate,
+                                           delay=args.delay, shim=shim))
+    joiner = await join(f"127.0.0.1:{args.port}", shim=shim)
+    hoster = await host_task
+    start = time.perf_counter()
+    host_state, join_state = await asyncio.gather(play_bot(hoster, args.frames), play_bot(joiner, args.frames))
+    elapsed = time.perf_counter() - start
+    in_sync = hoster.desync is None and joiner.desync is None and checksum(host_state) == checksum(join_state)
+    print(f"{args.frames} frames at {args.tick_rate} ticks/s, input delay {args.delay}, "
+          f"~{2 * args.latency:.0f} ms RTT +-{args.jitter:.0f} ms, {args.loss:.0%} loss: {elapsed:.1f}s")
+    print(f"match {'over at tick %d' % host_state.tick if host_state.game_over else 'still running'}, "
+          f"winners {host_state.winners}; sent {hoster.bytes_sent / args.frames:.1f} and {joiner.bytes_sent / args.frames:.1f} bytes/frame "
+          f"({hoster.packets_sent} and {joiner.packets_sent} packets)")
+    print("in sync" if in_sync else f"DESYNC (host {hoster.desync}, joiner {joiner.desync})")
+    hoster.close()
+    joiner.close()
+    return in_sync
+
+def main():
+    parser = argparse.ArgumentParser(description="Lockstep network play")
+    sub = parser.add_subparsers(dest="command", required=True)
+    host_cmd = sub.add_parser("host")
+    host_cmd.add_argument("port", type=int)
+    join_cmd = sub.add_parser("join")
+    join_cmd.add_argument("address")
+    for cmd in (host_cmd, join_cmd):
+        cmd.add_argument("--frames", type=int, default=600)
+    test = sub.add_parser("selftest", help="host and join on localhost through a lossy, laggy link")
+    test.add_argument("--port", type=int, default=5555)
+    test.add_argument("--frames", type=int, default=600)
+    test.add_argument("--tick-rate", type=int, default=tron_engine.FPS)
+    test.add_argument("--delay", type=int, help="input delay in frames (default: enough for the RTT)")
+    test.add_argument("--latency", type=float, default=60, help="one-way ms")
+    test.add_argument("--jitter", type=float, default=20, help="+- ms")
+    test.add_argument("--loss", type=float, default=0.1)
+    test.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "selftest":
+        if args.delay is None:
+            # Round trip plus jitter, in frames, and one to spare
+            args.delay = math.ceil((2 * args.latency + 2 * args.jitter) / 1000 * args.tick_rate) + 1
+        sys.exit(0 if asyncio.run(selftest(args)) else 1)
+
+    async def run():
+        peer = await (host(args.port) if args.command == "host" else join(args.address))
+        state = await play_bot(peer, args.frames)
+        print(f"tick {state.tick}, winners {state.winners}, {peer.bytes_sent / args.frames:.1f} bytes/frame, "
+              f"{'in sync' if peer.desync is None else 'DESYNC at frame %d' % peer.desync}")
+        peer.close()
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
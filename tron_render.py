@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import pygame
+
+# Drawing helpers shared by the pygame front-ends.
+
+# Arena backgrounds (fill plus grid lines), rendered once per size, cell size
+# and colour pair and converted to the display format. A different arena or
+# theme simply misses the cache and gets its own surface.
+_backgrounds = {}
+
+def display_format(surface):
+    return surface.convert() if pygame.display.get_surface() else surface
+
+def background(size, grid_size, color, grid_color):
+    key = (tuple(size), grid_size, color, grid_color)
+    surface = _backgrounds.get(key)
+    if surface is None:
+        width, height = size
+        surface = pygame.Surface(size)
+        surface.fill(color)
+        for x in range(0, width, grid_size):
+            pygame.draw.line(surface, grid_color, (x, 0), (x, height))
+        for y in range(0, height, grid_size):
+            pygame.draw.line(surface, grid_color, (0, y), (width, y))
+        surface = display_format(surface)
+        _backgrounds[key] = surface
+    return surface
+
+# Rendered text, keyed by everything font.render depends on. Menu labels,
+# buttons and the game-over banner are the same few strings every frame, so
+# they are rendered once; the least recently used entry goes when it is full.
+TEXT_CACHE_SIZE = 256
+_texts = OrderedDict()
+
+def render_text(font, text, color, antialias=True):
+    key = (text, font, color, antialias)
+    surface = _texts.get(key)
+    if surface is None:
+        surface = font.render(text, antialias, color)
+        _texts[key] = surface
+        if len(_texts) > TEXT_CACHE_SIZE:
+            _texts.popitem(last=False)
+    else:
+        _texts.move_to_end(key)
+    return surface
+
+# Trail layer: an offscreen copy of the visible part of the arena that
+# trails are painted into as they grow. Each frame only the cells appended
+# since the last one are drawn, and the caller copies just those rects to the
+# screen, so a frame costs the same with ten trail cells or ten thousand.
+#
+# The arena can be bigger than the layer. camera is the arena position (in
+# pixels, whole cells) shown at the layer's top-left; when it moves the layer
+# is scrolled and only the strips that came into view are redrawn, from a
+# one-byte-per-cell record of which bike painted each cell. Cells out of view
+# are only recorded, so the cost of a frame follows the view, not the arena.
+class TrailLayer:
+    def __init__(self, size, grid_size, draw_background):
+        self.surface = display_format(pygame.Surface(size))
+        self.grid_size = grid_size
+        self.draw_background = draw_background  # callable(surface)
+        self.players = []
+        self.painted = []
+        self.arena = tuple(size)
+        self.cols = self.rows = 0
+        self.owner = None  # per cell: 0 = unpainted, otherwise 1 + the index of the bike
+        self.camera = (0, 0)
+
+    def repaint(self, players, arena, camera):
+        self.players = list(players)
+        self.painted = [0] * len(self.players)
+        self.arena = arena
+        self.cols, self.rows = arena[0] // self.grid_size, arena[1] // self.grid_size
+        # Nothing to record when the whole arena fits the layer: it never scrolls
+        self.owner = None if arena == self.surface.get_size() else bytearray(self.cols * self.rows)
+        self.camera = camera
+        self.draw_background(self.surface)
+
+    def paint_area(self, rect):
+        # Redraw part of the layer from the owner record
+        size = self.grid_size
+        cam_x, cam_y = self.camera
+        self.surface.set_clip(rect)
+        self.draw_background(self.surface)
+        col0 = max(0, (rect.left + cam_x) // size)
+        col1 = min(self.cols, (rect.right + cam_x + size - 1) // size)
+        row0 = max(0, (rect.top + cam_y) // size)
+        row1 = min(self.rows, (rect.bottom + cam_y + size - 1) // size)
+        colors = [None] + [p.color for p in self.players]
+        for row in range(row0, row1):
+            line = self.owner[row * self.cols + col0:row * self.cols + col1]
+            for col, owner in enumerate(line, col0):
+                if owner:
+                    pygame.draw.rect(self.surface, colors[owner],
+                                     (col * size - cam_x, row * size - cam_y, size, size))
+        self.surface.set_clip(None)
+
+    def scroll(self, camera):
+        dx, dy = self.camera[0] - camera[0], self.camera[1] - camera[1]
+        self.camera = camera
+        width, height = self.surface.get_size()
+        if abs(dx) >= width or abs(dy) >= height:
+            self.paint_area(self.surface.get_rect())
+            return
+        self.surface.scroll(dx, dy)
+        if dx:
+            self.paint_area(pygame.Rect(0 if dx > 0 else width + dx, 0, abs(dx), height))
+        if dy:
+            self.paint_area(pygame.Rect(0, 0 if dy > 0 else height + dy, width, abs(dy)))
+
+    def update(self, players, lag=0, arena=None, camera=(0, 0)):
+        # Returns the rects of the layer that changed since the last call.
+        # The last `lag` cells of each trail are left for the caller to draw.
+        # arena is the arena size in pixels, by default the layer's own size
+        arena = tuple(arena or self.surface.get_size())
+        if players != self.players or arena != self.arena:
+            # A new match (reset makes new Player objects): start over
+            self.repaint(players, arena, camera)
+            dirty = [self.surface.get_rect()]
+        elif camera != self.camera:
+            self.scroll(camera)
+            dirty = [self.surface.get_rect()]
+        else:
+            dirty = []
+        size = self.grid_size
+        surface, owner, cols = self.surface, self.owner, self.cols
+        cam_x, cam_y = self.camera
+        arena_width, arena_height = arena
+        right, bottom = cam_x + surface.get_width(), cam_y + surface.get_height()
+        for i, player in enumerate(players):
+            end = max(len(player.trail) - lag, self.painted[i])
+            color = player.color
+            cells = player.trail[self.painted[i]:end]
+            self.painted[i] = end
+            if owner is None:
+                for x, y in cells:
+                    dirty.append(pygame.draw.rect(surface, color, (x, y, size, size)))
+                continue
+            for x, y in cells:
+                if 0 <= x < arena_width and 0 <= y < arena_height:
+                    owner[y // size * cols + x // size] = i + 1
+                    if cam_x <= x < right and cam_y <= y < bottom:
+                        dirty.append(pygame.draw.rect(surface, color, (x - cam_x, y - cam_y, size, size)))
+        return dirty
+
+    def restore(self, screen, rects):
+        # Copy parts of the layer back onto the screen
+        for rect in rects:
+            screen.blit(self.surface, rect, rect)
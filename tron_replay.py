@@ -0,0 +1,323 @@
+import os
+import struct
+import sys
+import time
+import zlib
+import tron_engine
+from tron_engine import BOOST_SPEED, DIRECTIONS, GRID_SIZE, apply_command, occupy, reset, step
+
+# Compact match replays.
+#
+# A replay is the match's starting setup (mode, difficulty, names, arena,
+# spawns, speeds, seed) followed by one small record per tick: each bike's
+# heading for that tick as a 2-bit index into tron_engine.DIRECTIONS and a
+# bit for whether it was boosting (any bike can, in a network match). The
+# records are bit-packed and zlib'd, so a 5000-tick three-bike match is a
+# few KB. Every KEYFRAME_INTERVAL ticks the
+# bikes' full state (position, heading, boost timers) is stored too, so
+# seek() only has to replay the ticks since the last keyframe. God mode or
+# tick rate changed from the console mid-match is stored with the tick it
+# took effect on (the tick rate sets how long a boost lasts). Playback sets
+# the recorded headings and runs tron_engine.step with the bots switched
+# off, so movement, boost and collisions go through the same code as the
+# original match and end up identical.
+
+MAGIC = b"TRNR"
+VERSION = 1
+KEYFRAME_INTERVAL = 256
+HEADING = {heading: index for index, heading in enumerate(DIRECTIONS)}
+# x, y, dx, dy, boost_active, boost_timer, boost_cooldown, alive, trail length
+BIKE_STATE = struct.Struct("<iibb?dd?I")
+# Per bike at the start: x, y, dx, dy, is_ai1, speed
+SPAWN = struct.Struct("<iibb?B")
+# tick, god_mode, tick_rate
+SETTINGS = struct.Struct("<I?H")
+
+def pack_str(text):
+    data = text.encode()
+    return struct.pack("<B", len(data)) + data
+
+def unpack_str(data, pos):
+    length = data[pos]
+    return bytes(data[pos + 1:pos + 1 + length]).decode(), pos + 1 + length
+
+def bike_state(player):
+    return (player.x, player.y, player.dx, player.dy, player.boost_active,
+            player.boost_timer, player.boost_cooldown, player.alive, len(player.trail))
+
+class Replay:
+    def __init__(self):
+        self.width = self.height = 0
+        self.game_mode = ""
+        self.ai_difficulty = ""
+        self.names = []
+        self.spawns = []  # (x, y, dx, dy) per bike
+        self.speeds = []  # cells per tick per bike, before boost
+        self.ai = []  # (ai_difficulty or "", is_ai1) per bike, for the record
+        self.seed = None
+        self.tick_rate = tron_engine.FPS
+        self.god_mode = False
+        self.settings = {}  # tick -> (god_mode, tick_rate) set from that tick on
+        self.survivors = []  # per bike, filled in when the match ends
+        self.game_over = False
+        self.ticks = []  # per tick: (heading index per bike, boosting per bike)
+        self.keyframes = {}  # tick -> [BIKE_STATE tuple per bike]
+        self.positions = None
+
+    @property
+    def length(self):
+        return len(self.ticks)
+
+    @property
+    def winners(self):
+        return [name for name, alive in zip(self.names, self.survivors) if alive]
+
+    def new_state(self):
+        # The match as it stood before its first tick, with every bike left
+        # to the replay rather than to a bot
+        state = tron_engine.GameState(self.width, self.height, seed=self.seed)
+        state.game_mode = self.game_mode
+        state.ai_difficulty = self.ai_difficulty or None
+        state.bike_count = len(self.spawns)
+        reset(state, seed=self.seed)
+        state.god_mode = self.god_mode
+        state.tick_rate = self.tick_rate
+        if len(self.spawns) > 2 and state.player3 is None:
+            state.player3 = tron_engine.Player(0, 0, 0, 0, tron_engine.GREEN, "")
+        for player, name, (x, y, dx, dy), speed in zip(state.players(), self.names, self.spawns, self.speeds):
+            player.name = name
+            player.x, player.y, player.dx, player.dy = x, y, dx, dy
+            player.speed = speed
+            player.trail = [(x, y)]
+            player.ai_difficulty = None
+        return state
+
+    def apply(self, state):
+        # Issue the recorded moves for the tick state is about to play
+        headings, boosting = self.ticks[state.tick]
+        if state.tick in self.settings:
+            state.god_mode, state.tick_rate = self.settings[state.tick]
+        players = state.players()
+        for player, heading in zip(players, headings):
+            player.dx, player.dy = DIRECTIONS[heading]
+        for player, boost in zip(players, boosting):
+            if boost and not player.boost_active:
+                apply_command(player, "boost")
+
+    def play(self, state, ticks=None):
+        end = self.length if ticks is None else min(self.length, state.tick + ticks)
+        while state.tick < end and not state.game_over:
+            self.apply(state)
+            step(state)
+        return state
+
+    def decode_positions(self):
+        # Every cell each bike sweeps, worked out from the headings and speeds
+        # alone; used to lay down the trails when seeking. A bike that went
+        # down keeps going here, but the keyframes say how much of its path
+        # is trail
+        self.positions = []
+        for bike, ((x, y, _, _), speed) in enumerate(zip(self.spawns, self.speeds)):
+            boosted = speed * BOOST_SPEED // GRID_SIZE
+            path = [(x, y)]
+            for headings, boosting in self.ticks:
+                dx, dy = DIRECTIONS[headings[bike]]
+                for _ in range(boosted if boosting[bike] else speed):
+                    x += dx
+                    y += dy
+                    path.append((x, y))
+            self.positions.append(path)
+
+    def seek(self, tick):
+        # A GameState at the given tick: restored from the last keyframe at
+        # or before it, then played forward
+        tick = max(0, min(tick, self.length))
+        if self.positions is None:
+            self.decode_positions()
+        start = max((k for k in self.keyframes if k <= tick), default=0)
+        state = self.new_state()
+        if start:
+            for player, path, saved in zip(state.players(), self.positions, self.keyframes[start]):
+                (player.x, player.y, player.dx, player.dy, player.boost_active,
+                 player.boost_timer, player.boost_cooldown, player.alive, length) = saved
+                player.trail = path[:length]
+                for x, y in player.trail[:-1]:
+                    occupy(state, x, y)
+                if not player.alive:
+                    occupy(state, player.x, player.y)
+            state.tick = start
+            changed = [t for t in self.settings if t < start]
+            if changed:
+                state.god_mode, state.tick_rate = self.settings[max(changed)]
+        return self.play(state, tick - start)
+
+    def to_bytes(self):
+        bikes = len(self.names)
+        out = [MAGIC, struct.pack("<BBII", VERSION, bikes, self.width, self.height),
+               pack_str(self.game_mode), pack_str(self.ai_difficulty)]
+        for name, (x, y, dx, dy), speed, (difficulty, is_ai1) in zip(self.names, self.spawns, self.speeds, self.ai):
+            out += [pack_str(name), SPAWN.pack(x, y, dx, dy, is_ai1, speed), pack_str(difficulty)]
+        survivors = sum(1 << i for i, alive in enumerate(self.survivors) if alive)
+        out.append(struct.pack("<?qH??QI", self.seed is not None, self.seed or 0, self.tick_rate,
+                               self.god_mode, self.game_over, survivors, self.length))
+        out.append(struct.pack("<I", len(self.keyframes)))
+        for tick in sorted(self.keyframes):
+            out.append(struct.pack("<I", tick))
+            out += [BIKE_STATE.pack(*saved) for saved in self.keyframes[tick]]
+        out.append(struct.pack("<I", len(self.settings)))
+        out += [SETTINGS.pack(tick, *self.settings[tick]) for tick in sorted(self.settings)]
+        # Tick records, 3 bits a bike (heading, then boost), least significant
+        # bit first
+        bits = bytearray()
+        acc = used = 0
+        for headings, boosting in self.ticks:
+            record = 0
+            for i, (heading, boost) in enumerate(zip(headings, boosting)):
+                record |= (heading | boost << 2) << 3 * i
+            acc |= record << used
+            used += 3 * bikes
+            while used >= 8:
+                bits.append(acc & 0xFF)
+                acc >>= 8
+                used -= 8
+        if used:
+            bits.append(acc)
+        packed = zlib.compress(bytes(bits), 9)
+        out += [struct.pack("<I", len(packed)), packed]
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # data can be bytes or a memoryview, e.g. a slice of an mmap
+        if bytes(data[:4]) != MAGIC:
+            raise ValueError("not a replay")
+        version, bikes, width, height = struct.unpack_from("<BBII", data, 4)
+        if version != VERSION:
+            raise ValueError(f"unsupported replay version {version}")
+        replay = cls()
+        replay.width, replay.height = width, height
+        replay.game_mode, pos = unpack_str(data, 14)
+        replay.ai_difficulty, pos = unpack_str(data, pos)
+        for _ in range(bikes):
+            name, pos = unpack_str(data, pos)
+            x, y, dx, dy, is_ai1, speed = SPAWN.unpack_from(data, pos)
+            difficulty, pos = unpack_str(data, pos + SPAWN.size)
+            replay.names.append(name)
+            replay.spawns.append((x, y, dx, dy))
+            replay.speeds.append(speed)
+            replay.ai.append((difficulty, is_ai1))
+        header = struct.Struct("<?qH??QI")
+        has_seed, seed, replay.tick_rate, replay.god_mode, replay.game_over, survivors, length = \
+            header.unpack_from(data, pos)
+        pos += header.size
+        replay.seed = seed if has_seed else None
+        replay.survivors = [bool(survivors >> i & 1) for i in range(bikes)]
+        count, = struct.unpack_from("<I", data, pos)
+        pos += 4
+        for _ in range(count):
+            tick, = struct.unpack_from("<I", data, pos)
+            pos += 4
+            replay.keyframes[tick] = [BIKE_STATE.unpack_from(data, pos + i * BIKE_STATE.size) for i in range(bikes)]
+            pos += bikes * BIKE_STATE.size
+        count, = struct.unpack_from("<I", data, pos)
+        pos += 4
+        for _ in range(count):
+            tick, god_mode, tick_rate = SETTINGS.unpack_from(data, pos)
+            replay.settings[tick] = (god_mode, tick_rate)
+            pos += SETTINGS.size
+        size, = struct.unpack_from("<I", data, pos)
+        bits = zlib.decompress(data[pos + 4:pos + 4 + size])
+        width_bits = 3 * bikes
+        mask = (1 << width_bits) - 1
+        acc = used = 0
+        it = iter(bits)
+        for _ in range(length):
+            while used < width_bits:
+                acc |= next(it) << used
+                used += 8
+            record = acc & mask
+            acc >>= width_bits
+            used -= width_bits
+            replay.ticks.append((tuple(record >> 3 * i & 3 for i in range(bikes)),
+                                 tuple(bool(record >> 3 * i & 4) for i in range(bikes))))
+        return replay
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+class ReplayRecorder:
+    # Call start() right after reset and record() after every step
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.replay = None
+
+    def start(self, state):
+        replay = self.replay = Replay()
+        replay.width, replay.height = state.width, state.height
+        replay.game_mode = state.game_mode or ""
+        replay.ai_difficulty = state.ai_difficulty or ""
+        replay.seed = state.seed
+        replay.tick_rate = state.tick_rate
+        replay.god_mode = state.god_mode
+        for player in state.players():
+            replay.names.append(player.name)
+            replay.spawns.append((player.x, player.y, player.dx, player.dy))
+            replay.speeds.append(player.speed)
+            replay.ai.append((player.ai_difficulty or "", player.is_ai1))
+        return replay
+
+    def record(self, state):
+        replay = self.replay
+        if replay is None or state.tick <= replay.length:
+            return  # nothing new: the match was already over
+        # A console change before this tick's step played in it
+        settings = (state.god_mode, state.tick_rate)
+        current = replay.settings[max(replay.settings)] if replay.settings else (replay.god_mode, replay.tick_rate)
+        if settings != current:
+            replay.settings[replay.length] = settings
+        players = state.players()
+        replay.ticks.append((tuple(HEADING[(p.dx, p.dy)] for p in players), tuple(p.boost_active for p in players)))
+        if state.tick % self.keyframe_interval == 0 and not state.game_over:
+            replay.keyframes[state.tick] = [bike_state(p) for p in players]
+        replay.game_over = state.game_over
+        replay.survivors = [p.alive for p in players] if state.game_over else []
+
+def same_match(a, b):
+    return (a.tick == b.tick and a.winners == b.winners
+            and [p.trail for p in a.players()] == [p.trail for p in b.players()])
+
+if __name__ == "__main__":
+    # python tron_replay.py <difficulty> <matches>: record bot matches, save
+    # them to replays/ and check that each one plays back and seeks exactly
+    difficulty = sys.argv[1] if len(sys.argv) > 1 else "hard"
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    os.makedirs("replays", exist_ok=True)
+    for seed in range(matches):
+        state = tron_engine.GameState(seed=seed)
+        state.game_mode = "dual_ai"
+        state.ai_difficulty = difficulty
+        reset(state, seed=seed)
+        state.player1.ai_difficulty = difficulty
+        recorder = ReplayRecorder()
+        recorder.start(state)
+        while not state.game_over and state.tick < 10000:
+            step(state)
+            recorder.record(state)
+        path = os.path.join("replays", f"{difficulty}-{seed}.trr")
+        recorder.replay.save(path)
+        start = time.perf_counter()
+        replay = Replay.load(path)
+        loaded = time.perf_counter() - start
+        played = replay.play(replay.new_state())
+        start = time.perf_counter()
+        middle = replay.seek(replay.length * 2 // 3)
+        sought = time.perf_counter() - start
+        exact = same_match(played, state) and same_match(replay.play(middle), state)
+        print(f"{path}: {state.tick} ticks, {os.path.getsize(path)} bytes, load {loaded * 1000:.1f} ms, "
+              f"seek {sought * 1000:.1f} ms, {'exact' if exact else 'MISMATCH'}")
@@ -0,0 +1,475 @@
+import multiprocessing
+import os
+import random
+from array import array
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from tron_world import snapshot
+
+# Alpha-beta search for the "insane" difficulty.
+#
+# Moves are simultaneous, so each ply is searched paranoid style: the bot
+# picks its move at a max node, then the opponents answer at a min node
+# knowing that move, and both are applied together. Positions are hashed
+# with Zobrist keys (one per occupied cell, one per bike per head cell) into
+# a fixed-size transposition table that the bot keeps between ticks, so
+# each search starts from what the last one already worked out.
+#
+# With more than one core the insane bot searches root-split (RootSplit):
+# each of its moves is a job for a process pool, and when there are more
+# workers than moves, each move's joint replies of the opponents are dealt
+# out over several jobs, so up to moves x replies workers (27 with two
+# opponents) have work. Every job deepens on its own until the shared time
+# runs out, and the parent takes the best move against the worst reply at
+# the deepest depth every job finished. A job carries the padded arena as raw bytes plus the
+# head cells and hash, never Player objects; each pool process keeps a
+# transposition table per board and bike between ticks.
+
+SEARCH_TIME = 0.03  # seconds per decision
+# Pool processes for RootSplit; 1 searches in-process. Pool processes (a
+# tournament's, say) and browsers have no pool of their own
+SPLIT_WORKERS = 1 if sys.platform == "emscripten" or multiprocessing.current_process().daemon else os.cpu_count() or 1
+MAX_DEPTH = 12
+TABLE_BITS = 16  # transposition table holds 2 ** TABLE_BITS entries
+EVAL_LIMIT = 400  # cells the leaf evaluation may visit
+RAY_LIMIT = 20  # free cells counted when ordering moves
+WIN = 100000
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class SearchTimeout(Exception):
+    pass
+
+class AlphaBeta:
+    def __init__(self, state, table_bits=TABLE_BITS, search_time=SEARCH_TIME):
+        self.cols = state.cols
+        self.rows = state.rows
+        self.grid_size = state.width // state.cols
+        self.stride = self.cols + 2
+        self.size = self.stride * (self.rows + 2)
+        # Headings in tron_engine.DIRECTIONS order: right, left, up, down
+        self.steps = (1, -1, -self.stride, self.stride)
+        self.search_time = search_time
+        rng = random.Random(0x7A0B)
+        # Packed 64-bit keys, the same values as successive getrandbits(64)
+        # calls but 8 bytes a cell, which matters on a big arena
+        self.occ_keys = array("Q", rng.randbytes(8 * self.size))
+        self.head_keys = []
+        self.table_mask = (1 << table_bits) - 1
+        self.table = [None] * (1 << table_bits)
+        # Scratch space for evaluate, reset by bumping the stamp
+        self.owner = [0] * self.size
+        self.owner_stamp = [0] * self.size
+        self.stamp = 0
+        self.generation = 0
+        self.occ_hash = 0
+        self.hashed = bytearray(self.size)  # cells mixed into occ_hash
+        self.trail_seen = []
+        self.match = None
+        self.best_move = None
+        self.stats = {"nodes": 0, "probes": 0, "hits": 0, "carried": 0, "time": 0.0, "depth": 0}
+
+    def head_key(self, bike, cell):
+        while len(self.head_keys) <= bike:
+            rng = random.Random(0x7A0B + len(self.head_keys) + 1)
+            self.head_keys.append(array("Q", rng.randbytes(8 * self.size)))
+        return self.head_keys[bike][cell]
+
+    def cell(self, x, y):
+        return (y // self.grid_size + 1) * self.stride + x // self.grid_size + 1
+
+    def load(self, state):
+        # Own copy of the tick's padded arena, every head blocked too (a head
+        # cell is trail as soon as its bike moves on): the search plays its
+        # moves on it
+        world = snapshot(state)
+        players = state.players()
+        # Trail cells are only ever added during a match, so the occupancy
+        # part of the hash is carried over and just the new cells are mixed
+        # in. The heads count as occupied, as play() makes them, so a position
+        # the search reached hashes the same once it is the root
+        match = (id(state), state.seed)
+        if match != self.match or len(self.trail_seen) != len(players) or any(
+                len(p.trail) < seen for p, seen in zip(players, self.trail_seen)):
+            self.match = match
+            self.occ_hash = 0
+            self.hashed = bytearray(self.size)
+            self.trail_seen = [0] * len(players)
+            self.table = [None] * len(self.table)
+        hashed = self.hashed
+        for i, player in enumerate(players):
+            for x, y in player.trail[self.trail_seen[i]:]:
+                if 0 <= x < state.width and 0 <= y < state.height:
+                    cell = self.cell(x, y)
+                    if not hashed[cell]:  # a bike that crashed into a trail ends on it
+                        hashed[cell] = 1
+                        self.occ_hash ^= self.occ_keys[cell]
+            self.trail_seen[i] = len(player.trail)
+        self.occ = bytearray(world.occupancy())
+        self.heads = list(world.heads)
+
+    def position_hash(self):
+        h = self.occ_hash ^ self.extra_hash
+        for bike, head in enumerate(self.heads):
+            if head is not None:
+                h ^= self.head_key(bike, head)
+        return h
+
+    def moves(self, bike):
+        # Free neighbours of a head, longest open run first
+        head = self.heads[bike]
+        occ = self.occ
+        result = []
+        for d, step in enumerate(self.steps):
+            n = head + step
+            if occ[n]:
+                continue
+            run = 1
+            n += step
+            while run < RAY_LIMIT and not occ[n]:
+                run += 1
+                n += step
+            result.append((run, d))
+        result.sort(reverse=True)
+        return [d for _, d in result]
+
+    def evaluate(self, me):
+        # Bounded Voronoi: cells this bike reaches first minus cells an
+        # opponent reaches first, searched outwards from all heads at once
+        occ = self.occ
+        steps = self.steps
+        owner, owner_stamp = self.owner, self.owner_stamp
+        self.stamp += 1
+        stamp = self.stamp
+        frontier = []
+        for bike, head in enumerate(self.heads):
+            if head is not None:
+                owner[head] = bike
+                owner_stamp[head] = stamp
+                frontier.append(head)
+        score = 0
+        visited = 0
+        while frontier and visited < EVAL_LIMIT:
+            # Cells first reached this round are stamped stamp + 1 so a tie
+            # between two bikes can still be spotted before they settle
+            reached = []
+            for c in frontier:
+                side = owner[c]
+                for step in steps:
+                    n = c + step
+                    if occ[n]:
+                        continue
+                    seen = owner_stamp[n]
+                    if seen == stamp:
+                        continue
+                    if seen != stamp + 1:
+                        owner_stamp[n] = stamp + 1
+                        owner[n] = side
+                        reached.append(n)
+                    elif owner[n] != side:
+                        owner[n] = -1  # tied, nobody's
+            frontier = []
+            for n in reached:
+                owner_stamp[n] = stamp
+                side = owner[n]
+                if side >= 0:
+                    frontier.append(n)
+                    score += 1 if side == me else -1
+            visited += len(reached)
+        self.stamp += 1
+        return score
+
+    def probe(self, key, depth, alpha, beta):
+        self.stats["probes"] += 1
+        entry = self.table[key & self.table_mask]
+        if entry is None or entry[0] != key:
+            return None, None
+        self.stats["hits"] += 1
+        _, entry_depth, value, flag, move, generation = entry
+        if generation != self.generation:
+            self.stats["carried"] += 1
+        if entry_depth >= depth:
+            if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                return value, move
+        return None, move
+
+    def store(self, key, depth, value, flag, move):
+        # Depth-preferred, but anything left over from an earlier tick can go
+        index = key & self.table_mask
+        entry = self.table[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.table[index] = (key, depth, value, flag, move, self.generation)
+
+    def max_node(self, me, depth, alpha, beta):
+        self.stats["nodes"] += 1
+        # A node costs a leaf evaluation of up to EVAL_LIMIT cells, a few
+        # hundred microseconds, so the clock is read every 16 to stay on time
+        if self.stats["nodes"] & 15 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if depth == 0:
+            return self.evaluate(me)
+        key = self.position_hash()
+        value, tt_move = self.probe(key, depth, alpha, beta)
+        if value is not None:
+            return value
+        moves = self.moves(me)
+        if not moves:
+            return -WIN - depth
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        original_alpha = alpha
+        best, best_move = -WIN * 2, moves[0]
+        for move in moves:
+            value = self.min_node(me, move, depth, alpha, beta)
+            if value > best:
+                best, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        flag = EXACT if original_alpha < best < beta else (LOWER if best >= beta else UPPER)
+        self.store(key, depth, best, flag, best_move)
+        return best
+
+    def replies(self, me):
+        # Every combination of opponent replies, strongest (longest run) first
+        replies = [[]]
+        for bike, head in enumerate(self.heads):
+            if bike == me or head is None:
+                continue
+            options = self.moves(bike) or [None]
+            replies = [r + [(bike, d)] for r in replies for d in options]
+        return replies
+
+    def min_node(self, me, my_move, depth, alpha, beta, replies=None):
+        # The worst of the replies (every one unless given) for my_move
+        best = WIN * 2
+        for reply in self.replies(me) if replies is None else replies:
+            value = self.play(me, [(me, my_move)] + reply, depth, alpha, beta)
+            best = min(best, value)
+            beta = min(beta, value)
+            if alpha >= beta:
+                break
+        return best
+
+    def play(self, me, joint, depth, alpha, beta):
+        # Apply one simultaneous move, recurse, then undo it
+        occ, heads, steps = self.occ, self.heads, self.steps
+        old_heads = list(heads)
+        old_extra = self.extra_hash
+        targets = {}
+        for bike, d in joint:
+            target = None if d is None else heads[bike] + steps[d]
+            if target is not None and occ[target]:
+                target = None
+            targets[bike] = target
+        landed = [t for t in targets.values() if t is not None]
+        for bike, target in targets.items():
+            if target is not None and landed.count(target) > 1:
+                targets[bike] = None  # head-on: both go down
+        changed = []
+        for bike, target in targets.items():
+            heads[bike] = target
+            if target is not None:
+                occ[target] = 1
+                changed.append(target)
+                self.extra_hash ^= self.occ_keys[target]
+        if heads[me] is None:
+            value = 0 if all(h is None for b, h in enumerate(heads) if b != me) else -WIN - depth
+        elif all(h is None for b, h in enumerate(heads) if b != me):
+            value = WIN + depth
+        else:
+            value = self.max_node(me, depth - 1, alpha, beta)
+        for c in changed:
+            occ[c] = 0
+        self.heads[:] = old_heads
+        self.extra_hash = old_extra
+        return value
+
+    def choose(self, state, player):
+        start = time.perf_counter()
+        self.deadline = start + self.search_time
+        self.generation += 1
+        self.load(state)
+        self.extra_hash = 0
+        me = state.players().index(player)
+        moves = self.moves(me)
+        if not moves:
+            return None
+        self.best_move = moves[0]
+        nodes = self.stats["nodes"]
+        try:
+            for depth in range(1, MAX_DEPTH + 1):
+                value = self.max_node(me, depth, -WIN * 2, WIN * 2)
+                entry = self.table[self.position_hash() & self.table_mask]
+                if entry is not None and entry[0] == self.position_hash():
+                    self.best_move = entry[4]
+                self.stats["depth"] = depth
+                if abs(value) >= WIN:
+                    break  # the outcome is already decided
+        except SearchTimeout:
+            pass
+        self.stats["time"] += time.perf_counter() - start
+        self.last_nodes = self.stats["nodes"] - nodes
+        return self.best_move
+
+    def report(self):
+        stats = self.stats
+        rate = stats["nodes"] / stats["time"] if stats["time"] else 0
+        hit_rate = stats["hits"] / stats["probes"] if stats["probes"] else 0
+        used, size = self.table_use()
+        return (f"{stats['nodes']} nodes, {rate:.0f} nodes/s, TT hit rate {hit_rate:.1%} "
+                f"({stats['carried']} hits from earlier ticks), table {used}/{size} used, last depth {stats['depth']}")
+
+    def table_use(self):
+        return len(self.table) - self.table.count(None), len(self.table)
+
+# Pool side of RootSplit: one searcher per (board size, bike searched for),
+# so no transposition table mixes up whose point of view a value is from
+searchers = {}
+
+def search_split(job):
+    cols, rows, grid_size, table_bits, me, occ, heads, occ_hash, generation, move, replies, budget = job
+    searcher = searchers.get((cols, rows, me))
+    if searcher is None:
+        board = SimpleNamespace(cols=cols, rows=rows, width=cols * grid_size)
+        searcher = searchers[cols, rows, me] = AlphaBeta(board, table_bits)
+    searcher.occ = bytearray(occ)
+    searcher.heads = list(heads)
+    searcher.occ_hash = occ_hash
+    searcher.extra_hash = 0
+    searcher.generation = generation
+    searcher.deadline = time.perf_counter() + budget
+    counted = dict(searcher.stats)
+    values = []  # the move's value against the worst of replies at depth 1, 2, ...
+    try:
+        for depth in range(1, MAX_DEPTH + 1):
+            values.append(searcher.min_node(me, move, depth, -WIN * 2, WIN * 2, replies))
+            if abs(values[-1]) >= WIN:
+                break
+    except SearchTimeout:
+        pass
+    counts = {key: searcher.stats[key] - counted[key] for key in ("nodes", "probes", "hits", "carried")}
+    return values, counts, (os.getpid(),) + searcher.table_use()
+
+pool = None
+
+def split_pool(workers):
+    # One pool for every RootSplit bot, started on first use. Spawned rather
+    # than forked, as the front-ends run threads, and without the script that
+    # started it: the jobs only need this module, and a spawned process
+    # re-runs __main__ first (a front-end would open a window in each). Hiding
+    # the script means patching __main__ for a moment, so only the main thread
+    # may start the pool (tron_worker does before a match); on any other
+    # thread this is None until then
+    global pool
+    if pool is None and threading.current_thread() is threading.main_thread():
+        main = sys.modules["__main__"]
+        hidden = {}
+        if main is not sys.modules[__name__]:
+            hidden = {key: main.__dict__[key] for key in ("__file__", "__spec__") if key in main.__dict__}
+            main.__dict__.pop("__file__", None)
+            main.__spec__ = None
+        try:
+            pool = multiprocessing.get_context("spawn").Pool(workers)
+        finally:
+            main.__dict__.update(hidden)
+    return pool
+
+class RootSplit(AlphaBeta):
+    def __init__(self, state, table_bits=TABLE_BITS, search_time=SEARCH_TIME, workers=None):
+        super().__init__(state, table_bits, search_time)
+        self.workers = SPLIT_WORKERS if workers is None else workers
+        self.table_bits = table_bits
+        self.tables = {}  # pool process id -> (entries used, table size) after its last job
+
+    def choose(self, state, player):
+        workers = split_pool(self.workers) if self.workers > 1 else None
+        if workers is None:
+            return super().choose(state, player)
+        start = time.perf_counter()
+        self.generation += 1
+        self.load(state)
+        me = state.players().index(player)
+        moves = self.moves(me)
+        if not moves:
+            return None
+        # Workers beyond one per move share out each move's replies, dealt
+        # round-robin so every job starts on a strong one; within a job the
+        # replies still cut each other off
+        replies = self.replies(me)
+        shares = max(1, min(len(replies), self.workers // len(moves)))
+        # The jobs run in rounds of one per worker; each round gets its
+        # share of the time so the whole decision still fits search_time
+        rounds = -(-len(moves) * shares // self.workers)
+        budget = max(self.search_time - (time.perf_counter() - start), 0.0) / rounds
+        board = (self.cols, self.rows, self.grid_size, self.table_bits, me,
+                 bytes(self.occ), tuple(self.heads), self.occ_hash, self.generation)
+        jobs = [board + (move, replies[share::shares], budget) for move in moves for share in range(shares)]
+        results = workers.map(search_split, jobs)
+        # Compare the moves at the deepest depth every job got through (a
+        # decided win or loss holds at any depth); before every job got
+        # through depth 1 the best-ordered move stands
+        depth = min(MAX_DEPTH if values and abs(values[-1]) >= WIN else len(values) for values, _, _ in results)
+        self.best_move = moves[0]
+        if depth:
+            worst = {}
+            for job, (values, _, _) in zip(jobs, results):
+                move = job[-3]
+                worst[move] = min(worst.get(move, WIN * 2), values[min(depth, len(values)) - 1])
+            self.best_move = max(moves, key=lambda move: worst[move])
+        self.stats["depth"] = depth
+        for _, counts, (pid, used, size) in results:
+            for key, count in counts.items():
+                self.stats[key] += count
+            self.tables[pid] = (used, size)
+        self.stats["time"] += time.perf_counter() - start
+        return self.best_move
+
+    def table_use(self):
+        # Summed over the pool processes' tables once the pool has searched
+        if not self.tables:
+            return super().table_use()
+        return tuple(map(sum, zip(*self.tables.values())))
+
+if __name__ == "__main__":
+    # Play the insane bot against extreme and print search statistics, e.g.
+    # python tron_search.py 18 to try a 2 ** 18 entry table
+    import tron_engine
+    table_bits = int(sys.argv[1]) if len(sys.argv) > 1 else TABLE_BITS
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # Each tick's root was a node in the search of the tick before, so the
+    # table must already hold it; otherwise nothing outlives its tick
+    state = tron_engine.GameState(seed=0)
+    state.game_mode = "ai"
+    tron_engine.reset(state, seed=0)
+    state.player1.ai_difficulty = "extreme"
+    state.player2.ai_difficulty = "insane"
+    planner = state.player2.planner = AlphaBeta(state, table_bits, search_time=0.1)
+    ticks = found = 0
+    while ticks < 20 and not state.game_over:
+        tron_engine.step(state)
+        ticks += 1
+        planner.load(state)
+        planner.extra_hash = 0
+        entry = planner.table[planner.position_hash() & planner.table_mask]
+        found += entry is not None and entry[0] == planner.position_hash()
+    print(f"root found in the table on {found} of {ticks} ticks")
+    if found < ticks // 2:
+        sys.exit(1)
+    wins = losses = 0
+    for seed in range(matches):
+        state = tron_engine.GameState(seed=seed)
+        state.game_mode = "ai"
+        tron_engine.reset(state, seed=seed)
+        bot, rival = (state.player1, state.player2) if seed % 2 == 0 else (state.player2, state.player1)
+        bot.ai_difficulty = "insane"
+        rival.ai_difficulty = "extreme"
+        bot.planner = RootSplit(state, table_bits)
+        tron_engine.play_match(state, 3000)
+        wins += bot.alive and not rival.alive
+        losses += rival.alive and not bot.alive
+        print(f"match {seed}: {state.tick} ticks, winners {state.winners}; {bot.planner.report()}")
+    print(f"insane vs extreme: {wins} wins, {losses} losses, {matches - wins - losses} draws")
@@ -0,0 +1,263 @@
+import re
+from collections import deque
+from tron_world import snapshot
+
+# Territory evaluation for the hard and extreme bots.
+#
+# Free cells (not trail, not a head) are split into connected regions. The
+# labels are kept up to date one cell at a time as bikes move: blocking a
+# cell only triggers a search when its free neighbours might have been cut
+# apart, and that search grows from each side at once so it stops after
+# exploring the smaller piece. Region size answers "how much room is behind
+# this move" in O(1); reach_first adds the Voronoi view of how many of those
+# cells the bike gets to before any opponent.
+
+SEARCH_LIMIT = 250  # cells a single reach_first search may visit
+SPLIT_LIMIT = 8192  # cells a split check may visit; bigger pockets stay in the region they came from
+FREE_RUN = re.compile(b"\x00+")
+
+class Territory:
+    def __init__(self, state):
+        self.cols = state.cols
+        self.rows = state.rows
+        self.grid_size = state.width // state.cols
+        # Cells are indexed on the arena plus a one-cell blocked border, so the
+        # four neighbours of any cell are always at these offsets
+        self.stride = self.cols + 2
+        self.steps = (1, -1, -self.stride, self.stride)
+        size = self.stride * (self.rows + 2)
+        self.label = [0] * size  # 0 = blocked, otherwise the region id
+        self.sizes = {}
+        self.next_label = 1
+        # Scratch space for the searches, reset by bumping the generation
+        self.seen = [0] * size
+        self.dist = [0] * size
+        self.mine_seen = [0] * size
+        self.mine_dist = [0] * size
+        self.generation = 0
+
+        # Label the free cells a row at a time: each row's runs of free cells
+        # (found by the regex engine, not a Python loop per cell) are joined
+        # to the runs they touch in the row above, so the cost follows the
+        # number of runs rather than the size of the arena
+        cols = self.cols
+        heads = {}
+        for player in state.players():
+            cell = self.cell(player.x, player.y)
+            if cell is not None:
+                heads.setdefault(cell // self.stride - 1, []).append(cell % self.stride - 1)
+        parent = []
+
+        def find(run):
+            while parent[run] != run:
+                parent[run] = parent[parent[run]]
+                run = parent[run]
+            return run
+
+        rows = []
+        above = []
+        for row in range(self.rows):
+            line = state.grid[row * cols:(row + 1) * cols]
+            if row in heads:
+                line = bytearray(line)
+                for x in heads[row]:
+                    line[x] = 1
+            runs = []
+            i = 0
+            for match in FREE_RUN.finditer(line):
+                start, end = match.span()
+                run = len(parent)
+                parent.append(run)
+                runs.append((start, end, run))
+                while i < len(above) and above[i][1] <= start:
+                    i += 1
+                j = i
+                while j < len(above) and above[j][0] < end:
+                    a, b = find(run), find(above[j][2])
+                    parent[max(a, b)] = min(a, b)
+                    j += 1
+            rows.append(runs)
+            above = runs
+        regions = {}
+        label = self.label
+        for row, runs in enumerate(rows):
+            base = (row + 1) * self.stride + 1
+            for start, end, run in runs:
+                root = find(run)
+                region = regions.get(root)
+                if region is None:
+                    region = regions[root] = self.next_label
+                    self.next_label += 1
+                    self.sizes[region] = 0
+                label[base + start:base + end] = [region] * (end - start)
+                self.sizes[region] += end - start
+
+    def cell(self, x, y):
+        x //= self.grid_size
+        y //= self.grid_size
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            return (y + 1) * self.stride + x + 1
+        return None
+
+    def area(self, c):
+        region = self.label[c]
+        return self.sizes[region] if region else 0
+
+    def block(self, c):
+        label = self.label
+        region = label[c]
+        if not region:
+            return
+        label[c] = 0
+        self.sizes[region] -= 1
+        if not self.sizes[region]:
+            del self.sizes[region]
+            return
+        stride = self.stride
+        ring = [label[c + offset] != 0 for offset in
+                (-stride, 1 - stride, 1, 1 + stride, stride, stride - 1, -1, -1 - stride)]
+        # Group the ring (clockwise from north) into runs of free cells;
+        # orthogonal neighbours in the same run are still joined around the
+        # corner, so only one per run needs to be searched from
+        if all(ring):
+            return
+        orthogonal = (-stride, None, 1, None, stride, None, -1, None)
+        first_blocked = ring.index(False)
+        seeds = []
+        run_seed = None
+        for i in range(first_blocked + 1, first_blocked + 9):
+            k = i % 8
+            if ring[k]:
+                if run_seed is None and orthogonal[k] is not None:
+                    run_seed = c + orthogonal[k]
+            elif run_seed is not None:
+                seeds.append(run_seed)
+                run_seed = None
+        if len(seeds) > 1:
+            self.split(region, seeds)
+
+    def split(self, region, seeds):
+        # Grow one search per seed in lockstep. Searches that touch are merged;
+        # a search that runs dry has walled off a new region. On a big arena
+        # two sides of a long trail can take a very long way round to meet,
+        # so after SPLIT_LIMIT cells the rest are taken to be still joined:
+        # every pocket smaller than that is found, only huge ones are missed
+        label = self.label
+        steps = self.steps
+        group = list(range(len(seeds)))
+
+        def find(g):
+            while group[g] != g:
+                g = group[g]
+            return g
+
+        owner = {s: g for g, s in enumerate(seeds)}
+        frontier = [deque([s]) for s in seeds]
+        members = [[s] for s in seeds]
+        live = set(range(len(seeds)))
+        visited = 0
+        while len(live) > 1 and visited < SPLIT_LIMIT:
+            visited += len(live)
+            for g in sorted(live):
+                if g not in live:
+                    continue
+                queue = frontier[g]
+                if not queue:
+                    new_region = self.next_label
+                    self.next_label += 1
+                    for c in members[g]:
+                        label[c] = new_region
+                    self.sizes[new_region] = len(members[g])
+                    self.sizes[region] -= len(members[g])
+                    live.discard(g)
+                    if len(live) == 1:
+                        break
+                    continue
+                c = queue.popleft()
+                for step in steps:
+                    n = c + step
+                    if label[n] != region:
+                        continue
+                    other = owner.get(n)
+                    if other is None:
+                        owner[n] = g
+                        members[g].append(n)
+                        queue.append(n)
+                    else:
+                        other = find(other)
+                        if other != g:
+                            group[other] = g
+                            queue.extend(frontier[other])
+                            members[g].extend(members[other])
+                            live.discard(other)
+
+    def block_head(self, player):
+        cell = self.cell(player.x, player.y)
+        if cell is not None:
+            self.block(cell)
+
+    def reach_first(self, state, player, positions):
+        # For each (x, y) the bike could move to, how many cells it reaches
+        # strictly before every opponent by going there. Opponents in other
+        # regions cannot contest anything, so the region size is the answer.
+        label = self.label
+        steps = self.steps
+        candidates = [self.cell(x, y) for x, y in positions]
+        regions = {label[c] for c in candidates if c is not None} - {0}
+        sources = [c for other, cells in zip(state.players(), snapshot(state).danger()) if other is not player
+                   for c in cells if label[c] in regions]
+        if not sources:
+            return [self.area(c) if c is not None else 0 for c in candidates]
+
+        # Opponent distances, one search from every opponent's next cells
+        self.generation += 1
+        opponent_gen = self.generation
+        seen, dist = self.seen, self.dist
+        queue = []
+        for c in sources:
+            if seen[c] != opponent_gen:
+                seen[c] = opponent_gen
+                dist[c] = 1
+                queue.append(c)
+        limit = SEARCH_LIMIT * 2
+        for c in queue:
+            if len(queue) >= limit:
+                break
+            d = dist[c] + 1
+            for step in steps:
+                n = c + step
+                if label[n] and seen[n] != opponent_gen:
+                    seen[n] = opponent_gen
+                    dist[n] = d
+                    queue.append(n)
+
+        counts = []
+        for start in candidates:
+            if start is None or not label[start]:
+                counts.append(0)  # off the arena or another bike's head
+                continue
+            # Only cells the bike wins are expanded: nothing behind a cell the
+            # opponent reaches first can be won through it
+            self.generation += 1
+            mine_gen = self.generation
+            mine_seen, mine_dist = self.mine_seen, self.mine_dist
+            mine_seen[start] = mine_gen
+            mine_dist[start] = 1
+            queue = [start]
+            owned = 0
+            for c in queue:
+                d = mine_dist[c]
+                if seen[c] == opponent_gen and dist[c] <= d:
+                    continue
+                owned += 1
+                if owned >= SEARCH_LIMIT:
+                    break
+                d += 1
+                for step in steps:
+                    n = c + step
+                    if label[n] and mine_seen[n] != mine_gen:
+                        mine_seen[n] = mine_gen
+                        mine_dist[n] = d
+                        queue.append(n)
+            counts.append(owned)
+        return counts
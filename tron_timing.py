@@ -0,0 +1,163 @@
+import cProfile
+import csv
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Per-phase frame timings. Each phase keeps its last RING_SIZE durations in
+# a fixed ring, so the percentiles are always over the recent past and the
+# memory never grows however long the game runs. The game loop calls mark()
+# after each phase; the time since the previous mark is charged to it.
+
+RING_SIZE = 1024
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples during a profile capture
+# Before 3.12 a cProfile profiler only sees the thread that enabled it
+PER_THREAD_PROFILE = sys.version_info < (3, 12)
+# The browser build (pygbag) cannot start threads, so it gets no stack sampler
+THREADS = sys.platform != "emscripten"
+
+class PhaseTimer:
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.rings = {}  # phase -> [samples, next slot, samples taken]
+        self.last = None
+        self.frame_start = None
+
+    def start(self):
+        self.last = self.frame_start = time.perf_counter()
+
+    def mark(self, phase, elsewhere=0.0):
+        # elsewhere: seconds of this stretch already recorded under another phase
+        now = time.perf_counter()
+        if self.last is not None:
+            self.record(phase, now - self.last - elsewhere)
+        self.last = now
+
+    def end_frame(self):
+        self.mark("display")
+        if self.frame_start is not None:
+            self.record("frame", self.last - self.frame_start)
+
+    def record(self, phase, seconds):
+        ring = self.rings.get(phase)
+        if ring is None:
+            ring = self.rings[phase] = [[0.0] * self.size, 0, 0]
+        ring[0][ring[1]] = seconds
+        ring[1] = (ring[1] + 1) % self.size
+        ring[2] += 1
+
+    def summary(self):
+        # phase -> (samples taken, p50, p95, p99, max), in milliseconds
+        result = {}
+        for phase, (samples, _, taken) in self.rings.items():
+            recent = sorted(samples[:min(taken, self.size)])
+            n = len(recent)
+            result[phase] = (taken,) + tuple(recent[min(n - 1, int(n * q))] * 1000 for q in (0.5, 0.95, 0.99)) \
+                + (recent[-1] * 1000,)
+        return result
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["phase", "samples", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+            for phase, (taken, p50, p95, p99, worst) in self.summary().items():
+                writer.writerow([phase, taken, f"{p50:.4f}", f"{p95:.4f}", f"{p99:.4f}", f"{worst:.4f}"])
+
+# A profile of the running game for a fixed number of seconds: cProfile for
+# exact call counts and times (written as a .pstats file), plus a thread that
+# samples the game thread's stack every SAMPLE_INTERVAL and writes the
+# counts as collapsed stacks ("a;b;c 12" lines) for flame graph tools. None
+# of it exists until a capture is started, so there is nothing to pay for
+# the rest of the time. Another thread doing the game's work (the bot
+# worker) wraps each stretch of it in begin_thread()/end_thread(): it is
+# sampled meanwhile, its stacks under its name, and profiled into the same
+# .pstats file. A stretch still running at the deadline is waited for a
+# frame at a time, never blocked on. Without THREADS there is no sampler
+# and only the .pstats file is written.
+class ProfileCapture:
+    def __init__(self, seconds, prefix="tron_profile"):
+        self.seconds = seconds
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.pstats_path = f"{prefix}_{stamp}.pstats"
+        self.collapsed_path = f"{prefix}_{stamp}.collapsed" if THREADS else None
+        self.profiler = cProfile.Profile()
+        self.stacks = {}
+        self.thread_id = threading.get_ident()
+        self.busy = {}  # other thread's id -> name, while it is in begin_thread()/end_thread()
+        self.thread_profilers = {}  # other thread's id -> its profiler
+        self.lock = threading.Lock()  # guards busy, thread_profilers and over
+        self.over = False  # set at the deadline: no other thread starts a stretch after it
+        self.stopping = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True) if THREADS else None
+        self.deadline = None
+
+    def start(self):
+        self.deadline = time.perf_counter() + self.seconds
+        if self.sampler:
+            self.sampler.start()
+        self.profiler.enable()
+
+    def begin_thread(self, name):
+        # From the other thread; False once the capture is over
+        ident = threading.get_ident()
+        with self.lock:
+            if self.over:
+                return False
+            self.busy[ident] = name
+            profiler = self.thread_profilers.setdefault(ident, cProfile.Profile()) if PER_THREAD_PROFILE else None
+        if profiler:
+            profiler.enable()
+        return True
+
+    def end_thread(self):
+        # A thread's profiler is only ever switched on and off by that thread
+        ident = threading.get_ident()
+        if PER_THREAD_PROFILE:
+            self.thread_profilers[ident].disable()
+        with self.lock:
+            del self.busy[ident]
+
+    def sample(self):
+        while not self.stopping.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, name in [(self.thread_id, None)] + list(self.busy.items()):
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if name:
+                    names.append(name)
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def poll(self):
+        # Called once a frame from the game thread; True once the capture is
+        # over and its files are written
+        if time.perf_counter() < self.deadline:
+            return False
+        if not self.over:
+            self.profiler.disable()
+            with self.lock:
+                self.over = True
+            if self.sampler:
+                self.stopping.set()
+                self.sampler.join()
+        with self.lock:
+            if self.busy:
+                return False  # another thread's profiler is still on until its end_thread()
+        stats = pstats.Stats(self.profiler)
+        for profiler in self.thread_profilers.values():
+            stats.add(profiler)
+        stats.dump_stats(self.pstats_path)
+        if self.collapsed_path:
+            with open(self.collapsed_path, "w") as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+        return True
+
+    def paths(self):
+        return [path for path in (self.pstats_path, self.collapsed_path) if path]
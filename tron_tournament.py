@@ -0,0 +1,163 @@
+import argparse
+import itertools
+import os
+import time
+from multiprocessing import Pool
+from tron_batch import AI_SETTINGS, BatchState
+import tron_engine
+
+# Round-robin tournament between AI settings. Every entrant is a difficulty
+# played with either the AI 1 (is_ai1) or the AI 2 parameters from ai_move.
+# Games are grouped into batches, spread over a process pool and each game
+# gets a fixed seed, so the same command always reproduces the same table.
+# tron_batch is much faster but has no territory evaluation, so by default
+# only groups without hard or extreme run on it and the rest play through
+# tron_engine, as in the game. --engine plays every group through
+# tron_engine; --batch plays every group on tron_batch, and the table then
+# lists hard and extreme as "hard-rays" and "extreme-rays", since those are
+# not the bots the game plays.
+
+ELO_START = 1500
+ELO_K = 16
+
+def entrant_name(difficulty, is_ai1):
+    return difficulty if is_ai1 else difficulty + ":ai2"
+
+def parse_entrant(name):
+    difficulty, _, params = name.partition(":")
+    return difficulty, params != "ai2"
+
+def game_seed(base_seed, pairing, game):
+    return (base_seed * 1_000_003 + pairing) * 100_003 + game
+
+def needs_engine(group):
+    return any(parse_entrant(name)[0] in tron_engine.TERRITORY_DIFFICULTIES for name in group)
+
+def display_name(name, use_engine):
+    # What the table calls an entrant: a territory tier played on tron_batch
+    # is only its ray half
+    difficulty, _, params = name.partition(":")
+    if use_engine is False and difficulty in tron_engine.TERRITORY_DIFFICULTIES:
+        return difficulty + "-rays" + (":" + params if params else "")
+    return name
+
+def schedule(entrants, bikes, games, base_seed, chunk, use_engine=None):
+    # Every group of `bikes` entrants plays `games` games, cycling through the
+    # seatings so no one always gets the same spawn. use_engine None picks
+    # per group (needs_engine)
+    tasks = []
+    for pairing, group in enumerate(itertools.combinations(entrants, bikes)):
+        engine = needs_engine(group) if use_engine is None else use_engine
+        seatings = list(itertools.permutations(group))
+        for start in range(0, games, chunk):
+            by_seating = {}
+            for game in range(start, min(start + chunk, games)):
+                seating = seatings[game % len(seatings)]
+                by_seating.setdefault(seating, []).append(game_seed(base_seed, pairing, game))
+            for seating, seeds in by_seating.items():
+                tasks.append((seating, seeds, engine))
+    return tasks
+
+def play_engine_games(seating, settings, seeds, max_ticks):
+    games = []
+    for seed in seeds:
+        state = tron_engine.GameState(seed=seed)
+        state.game_mode = "dual_ai" if len(seating) == 3 else "ai"
+        tron_engine.reset(state, seed=seed)
+        for player, (difficulty, is_ai1) in zip(state.players(), settings):
+            player.ai_difficulty = difficulty
+            player.is_ai1 = is_ai1
+        tron_engine.play_match(state, max_ticks)
+        games.append((state.tick, [p.alive for p in state.players()] if state.game_over else [False] * len(seating)))
+    return seating, games
+
+def play_games(task, max_ticks=10000):
+    seating, seeds, use_engine = task
+    settings = [parse_entrant(name) for name in seating]
+    if use_engine:
+        return play_engine_games(seating, settings, seeds, max_ticks)
+    batch = BatchState(seeds, [d for d, _ in settings], [flag for _, flag in settings]).run(max_ticks)
+    # One (length, survivors) pair per game; nobody survives a timeout draw
+    return seating, [(int(batch.length[k]), [bool(a) for a in batch.alive[k]] if batch.done[k] else [False] * len(seating))
+                     for k in range(len(seeds))]
+
+def fit_elo(pair_scores, names, rounds=200):
+    # Fixed point of the Elo update over all games at once, so the ratings do
+    # not depend on the order the pool returned results in
+    ratings = dict.fromkeys(names, float(ELO_START))
+    for _ in range(rounds):
+        change = dict.fromkeys(names, 0.0)
+        for (a, b), (score, count) in pair_scores.items():
+            expected = 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400))
+            delta = ELO_K * (score - expected * count) / count
+            change[a] += delta
+            change[b] -= delta
+        for name in names:
+            ratings[name] += change[name]
+    mean = sum(ratings.values()) / len(ratings)
+    return {name: rating - mean + ELO_START for name, rating in ratings.items()}
+
+def tally(results, names):
+    stats = {name: {"games": 0, "wins": 0, "draws": 0, "ticks": 0} for name in names}
+    pair_scores = {}
+    for seating, games in results:
+        for length, alive in games:
+            for seat, name in enumerate(seating):
+                entry = stats[name]
+                entry["games"] += 1
+                entry["ticks"] += length
+                if alive[seat]:
+                    # A win needs someone else to have crashed
+                    if not all(alive):
+                        entry["wins"] += 1
+                    else:
+                        entry["draws"] += 1
+                elif not any(alive):
+                    entry["draws"] += 1
+            # Multi-bike games count as every pairwise result among the seats
+            for i, j in itertools.combinations(range(len(seating)), 2):
+                a, b = sorted((seating[i], seating[j]))
+                score_a = 0.5 if alive[i] == alive[j] else float(alive[i] if a == seating[i] else alive[j])
+                score, count = pair_scores.get((a, b), (0.0, 0))
+                pair_scores[(a, b)] = (score + score_a, count + 1)
+    return stats, pair_scores
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-robin AI tournament with Elo ratings")
+    parser.add_argument("--difficulties", nargs="+", default=list(AI_SETTINGS), choices=list(AI_SETTINGS))
+    parser.add_argument("--no-ai2", action="store_true", help="only enter the AI 1 parameter set")
+    parser.add_argument("--bikes", type=int, default=2, choices=[2, 3], help="2 = ai mode, 3 = dual_ai mode")
+    parser.add_argument("--games", type=int, default=200, help="games per group of entrants")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=500, help="games per batch sent to a worker")
+    engines = parser.add_mutually_exclusive_group()
+    engines.add_argument("--engine", dest="use_engine", action="store_const", const=True,
+                         help="play every game through tron_engine")
+    engines.add_argument("--batch", dest="use_engine", action="store_const", const=False,
+                         help="play every game on tron_batch (hard and extreme without territory)")
+    args = parser.parse_args()
+
+    entrants = [entrant_name(d, True) for d in args.difficulties]
+    if not args.no_ai2:
+        entrants += [entrant_name(d, False) for d in args.difficulties]
+    tasks = schedule(entrants, args.bikes, args.games, args.seed, args.chunk, args.use_engine)
+
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        results = list(pool.imap_unordered(play_games, tasks))
+    elapsed = time.perf_counter() - start
+
+    stats, pair_scores = tally(results, entrants)
+    ratings = fit_elo(pair_scores, entrants)
+    total = sum(len(games) for _, games in results)
+    print(f"{total} games on {args.workers} workers in {elapsed:.1f}s ({total / elapsed * 60:.0f} games/min)")
+    print(f"{'entrant':<18}{'elo':>7}{'games':>8}{'win%':>8}{'draw%':>8}{'mean len':>10}")
+    for name in sorted(entrants, key=ratings.get, reverse=True):
+        entry = stats[name]
+        games = entry["games"] or 1
+        print(f"{display_name(name, args.use_engine):<18}{ratings[name]:>7.0f}{entry['games']:>8}{100 * entry['wins'] / games:>8.1f}"
+              f"{100 * entry['draws'] / games:>8.1f}{entry['ticks'] / games:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import copy
+import queue
+import sys
+import threading
+import time
+import traceback
+import tron_engine
+from tron_engine import ai_heading, extend_trail, occupy
+from tron_search import SPLIT_WORKERS, RootSplit, split_pool
+
+# Bot decisions off the game loop's thread.
+#
+# A worker thread keeps its own mirror of the match: after every tick the
+# game loop posts what happened (the cells each bike swept, its heading,
+# whether it is still alive) and the worker replays it onto the mirror in
+# the engine's order, then works out every bot's heading for the next tick
+# there, planners and territory included. Nothing the game loop draws from
+# is ever touched by the worker, so the loop keeps rendering and reading
+# input while the bots think. When a tick is due and the worker has not
+# answered for it, each bot gets the ray heuristic on the spot instead
+# (ai_heading with rays_only) and the worker's late answer is dropped. The
+# planners search until they run out of their share of THINK_SHARE of a
+# tick and answer with the best move so far, so they normally make it.
+# What each bot took to decide goes to the game loop's PhaseTimer along with
+# the answer, under the same "ai_move <name>" phase as a bot that thinks in
+# step(); the ray fallback is timed as "ai fallback". An exception in the
+# worker is printed and the worker sits the rest of that match out. A
+# match with a RootSplit bot gets the search's process pool started by
+# start(), on the game loop's thread, as only that thread may start it.
+#
+# Browsers (pygbag) have no threads; there, and in matches without bots,
+# decisions() returns None and step() runs the bots itself as before.
+
+THREADS = sys.platform != "emscripten"
+THINK_SHARE = 0.5  # of each tick the planner bots may spend thinking, between them
+
+def mirror(state):
+    # An engine-only copy of a freshly reset match
+    world = tron_engine.GameState(state.width, state.height, seed=state.seed)
+    world.bikes = copy.deepcopy(state.bikes)
+    world.bike_count = state.bike_count
+    world.grid = bytearray(state.grid)
+    world.runs = copy.deepcopy(state.runs)
+    world.game_mode = state.game_mode
+    world.ai_difficulty = state.ai_difficulty
+    world.use_territory = state.use_territory
+    world.ai_target_player = state.ai_target_player
+    world.tick = state.tick
+    world.rng = copy.deepcopy(state.rng)
+    return world
+
+class BotWorker:
+    def __init__(self):
+        self.jobs = queue.SimpleQueue()
+        self.latest = (0, 0, None, None)  # (match, tick, {bike: heading}, {bike: seconds}) last worked out
+        self.match = 0  # bumped by start(), so answers about an old match are ignored
+        self.sent = []  # trail length per bike already posted
+        self.posted = 0  # tick of the last post
+        self.active = False  # the current match has bots
+        self.thread = None
+        self.decided = 0  # ticks the worker answered in time
+        self.fallbacks = 0  # ticks the ray heuristic had to stand in
+        self.think_time = 0.0  # worst time the worker spent deciding one tick
+        self.error = (0, None)  # (match, what went wrong) when the worker gave up on a match
+        self.profile = None  # tron_timing.ProfileCapture running, if any
+        self.tick_rate = tron_engine.FPS
+
+    def start(self, state):
+        # Call right after reset
+        self.active = THREADS and any(p.ai_difficulty for p in state.players())
+        if not self.active:
+            return
+        if SPLIT_WORKERS > 1 and any(tron_engine.PLANNERS.get(p.ai_difficulty) is RootSplit for p in state.players()):
+            split_pool(SPLIT_WORKERS)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.match += 1
+        self.sent = [len(p.trail) for p in state.players()]
+        self.posted = state.tick
+        self.jobs.put(("start", self.match, mirror(state)))
+
+    def post(self, state):
+        # Call after every step
+        if not self.active or state.tick == self.posted:
+            return
+        self.posted = state.tick
+        bikes = []
+        for i, player in enumerate(state.players()):
+            bikes.append((tuple(player.trail[self.sent[i]:]), player.dx, player.dy, player.alive))
+            self.sent[i] = len(player.trail)
+        self.jobs.put(("tick", self.match, state.tick, bikes, state.ai_target_player, state.game_over))
+        self.tick_rate = state.tick_rate
+
+    def decisions(self, state, timer=None):
+        # Headings for the tick state is about to play, as step() takes them
+        if not self.active or state.game_over:
+            return None
+        match, tick, headings, times = self.latest
+        players = state.players()
+        if match == self.match and tick == state.tick:
+            self.decided += 1
+            if timer:
+                for i, seconds in times.items():
+                    timer.record("ai_move " + players[i].name, seconds)
+            return headings
+        self.fallbacks += 1
+        headings = {i: ai_heading(state, p, rays_only=True)
+                    for i, p in enumerate(players) if p.alive and p.ai_difficulty}
+        if timer:
+            timer.mark("ai fallback")
+        return headings
+
+    def report(self):
+        # One line for the timings overlay
+        match, error = self.error
+        if match == self.match:
+            return f"bot worker stopped: {error}"
+        return f"bots {self.decided} on time, {self.fallbacks} late, worst {self.think_time * 1000:.0f} ms"
+
+    def run(self):
+        match, world = None, None
+        while True:
+            job = self.jobs.get()
+            capture = self.profile
+            profiling = capture is not None and capture.begin_thread("bot worker")
+            try:
+                if job[0] == "start":
+                    _, match, world = job
+                elif job[1] == match:
+                    replay_tick(world, *job[2:])
+                else:
+                    continue
+                if not self.jobs.empty() or world.game_over:
+                    continue  # behind: catch up before thinking again
+                self.think(match, world)
+            except Exception as error:
+                # The mirror can no longer be trusted: the ray fallback plays
+                # the bots until the next match
+                traceback.print_exc()
+                self.error = (match, f"{type(error).__name__}: {error}")
+                match = None
+            finally:
+                if profiling:
+                    capture.end_thread()
+
+    def think(self, match, world):
+        start = time.perf_counter()
+        bots = [(i, p) for i, p in enumerate(world.players()) if p.alive and p.ai_difficulty]
+        planners = sum(p.ai_difficulty in tron_engine.PLANNERS for _, p in bots)
+        search_time = THINK_SHARE / self.tick_rate / max(planners, 1)
+        headings, times = {}, {}
+        for i, player in bots:
+            began = time.perf_counter()
+            headings[i] = ai_heading(world, player, search_time=search_time)
+            times[i] = time.perf_counter() - began
+        self.think_time = max(self.think_time, time.perf_counter() - start)
+        self.latest = (match, world.tick, headings, times)
+
+def replay_tick(state, tick, bikes, target, game_over):
+    # Lay one posted tick onto the mirror: the swept cells a sub-step at a
+    # time in bike order, each wreck occupied in the sub-step it crashed, as
+    # step() did
+    players = state.players()
+    for player, (_, dx, dy, _) in zip(players, bikes):
+        player.dx, player.dy = dx, dy
+    for sub_step in range(max((len(cells) for cells, _, _, _ in bikes), default=0)):
+        for player, (cells, _, _, _) in zip(players, bikes):
+            if len(cells) > sub_step:
+                player.x, player.y = cells[sub_step]
+                extend_trail(state, player)
+                if state.territory:
+                    state.territory.block_head(player)
+        for player, (cells, _, _, alive) in zip(players, bikes):
+            if len(cells) == sub_step + 1 and not alive:
+                occupy(state, player.x, player.y)
+    for player, (_, _, _, alive) in zip(players, bikes):
+        player.alive = alive
+    state.tick = tick
+    state.ai_target_player = target
+    state.game_over = game_over
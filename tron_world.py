@@ -0,0 +1,69 @@
+# Per-tick view of the board, shared by every bot that decides in a tick.
+#
+# Each bot used to work the same things out from the GameState on its own:
+# the heads bucketed by position for trap scoring, the padded occupancy the
+# planners search on, the cells every opponent can move into next. snapshot()
+# builds each piece the first time a bot asks for it during a tick and hands
+# the same object to every later caller; advancing the tick (or a reset)
+# retires it. Everything in it is read-only: a planner that plays moves on
+# the occupancy copies it first. Cells use the planners' layout, the arena
+# plus a one-cell blocked border.
+
+class Snapshot:
+    def __init__(self, state):
+        self.state = state
+        self.tick = state.tick
+        self.cols = state.cols
+        self.rows = state.rows
+        self.grid_size = state.width // state.cols
+        self.stride = self.cols + 2
+        self.steps = (1, -1, -self.stride, self.stride)
+        # Padded head cell per bike, None once it is out (crashed or off the
+        # arena): a wreck blocks its cell but never moves again
+        self.heads = [self.cell(p.x, p.y) if p.alive else None for p in state.players()]
+        self.occ = None
+        self.buckets = {}  # bucket size -> {bucket: [live bikes]}
+        self.next_cells = None
+
+    def cell(self, x, y):
+        if 0 <= x < self.state.width and 0 <= y < self.state.height:
+            return (y // self.grid_size + 1) * self.stride + x // self.grid_size + 1
+        return None
+
+    def occupancy(self):
+        # 1 for every trail cell, every head or wreck and the border
+        if self.occ is None:
+            cols, stride, grid = self.cols, self.stride, self.state.grid
+            occ = bytearray(b"\x01" * stride * (self.rows + 2))
+            for row in range(self.rows):
+                start = (row + 1) * stride + 1
+                occ[start:start + cols] = grid[row * cols:(row + 1) * cols]
+            for player in self.state.players():
+                head = self.cell(player.x, player.y)
+                if head is not None:
+                    occ[head] = 1
+            self.occ = occ
+        return self.occ
+
+    def bucketed(self, size):
+        # Live bikes grouped by the size x size pixel square their head is in
+        buckets = self.buckets.get(size)
+        if buckets is None:
+            buckets = self.buckets[size] = {}
+            for player in self.state.players():
+                if player.alive:
+                    buckets.setdefault((player.x // size, player.y // size), []).append(player)
+        return buckets
+
+    def danger(self):
+        # Per bike, the cells next to its head, which it may enter next tick;
+        # empty for a bike that is out
+        if self.next_cells is None:
+            self.next_cells = [[head + step for step in self.steps] if head is not None else [] for head in self.heads]
+        return self.next_cells
+
+def snapshot(state):
+    world = state.world
+    if world is None or world.tick != state.tick:
+        world = state.world = Snapshot(state)
+    return world